@@ -15,6 +15,8 @@ import time
 
 from myLib import printMessage, runCheck, set_parameter
 from myLib import align_n, align_y, saveConfigFile
+from myLib import databases_check, database_check, serviceDatabases
+from myLib import provisionDatabases
 
 logging.info("################# "\
              + os.path.dirname(os.path.abspath(__file__)) + \
@@ -113,11 +115,14 @@ def install_packages():
         logging.info(item +" is version "+ var1)
 
 
-    # Install RDO repository for Juno
-    print('installing yum-plugin-priorities and epel-release')
-    msg = 'Install rdo-release-juno.rpm'
-    runCheck(msg, 'yum -y localinstall https://repos.fedorapeople.org/repos/openstack/openstack-juno/rdo-release-juno-1.noarch.rpm')
-    logging.info(msg)
+    # Install RDO repository for Juno, unless a previous run did
+    if run('rpm -q rdo-release', quiet=True).succeeded:
+        print blue('rdo-release already installed on ' + env.host)
+    else:
+        print('installing rdo-release-juno')
+        msg = 'Install rdo-release-juno.rpm'
+        runCheck(msg, 'yum -y localinstall https://repos.fedorapeople.org/repos/openstack/openstack-juno/rdo-release-juno-1.noarch.rpm')
+        logging.info(msg)
 
 
     # Install Crudini and wget
@@ -189,6 +194,13 @@ def secureDB():
     printMessage("good","********** MySQL is installed, configured and secured *************")
     logging.info("********** MySQL is installed, configured and secured *************")
 
+@roles('controller')
+def provision_databases():
+    """
+    Create the databases of all the services in one go
+    """
+    provisionDatabases()
+
 @roles('controller')
 def tdd_DB():
     if (env.host != "controller"):
@@ -201,6 +213,25 @@ def tdd_DB():
         printMessage("good",msg)
         print("Here is a list of the current databases:\n %s"% result)
 
+@roles('controller')
+def tdd_service_databases():
+    """
+    Health of the databases of all the services, from one query
+    """
+    results = databases_check()
+    print "\n%-10s %7s %12s %10s" % ('DB', 'tables', 'size (kB)', 'rows')
+    for db in serviceDatabases:
+        info = results[db]
+        if info['exists']:
+            print "%-10s %7d %12d %10d" % (db, info['tables'], info['size'] / 1024, info['rows'])
+        else:
+            print "%-10s %7s" % (db, 'absent')
+    print
+
+    for db in serviceDatabases:
+        if results[db]['exists']:
+            database_check(db, results=results)
+
 
 @roles('controller','network','storage','compute')
 @with_settings(warn_only=True)
@@ -352,6 +383,7 @@ def deploy():
     execute(install_packages)
     execute(installMariaDB)
     execute(secureDB)
+    execute(provision_databases)
     # execute(shrinkHome)
     # execute(prepGlusterFS)
     # execute(setupGlusterFS)
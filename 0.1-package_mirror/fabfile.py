@@ -0,0 +1,147 @@
+from __future__ import with_statement
+from fabric.api import *
+from fabric.contrib.files import exists
+from fabric.colors import green, red, blue
+from StringIO import StringIO
+import logging
+import sys
+sys.path.append('..')
+import env_config
+from myLib import runCheck, printMessage, align_y, align_n
+from myLib import ensurePackages, componentPackages
+
+############################ Config ########################################
+
+env.roledefs = env_config.roledefs
+
+# where the controller keeps the mirror, and where the nodes find it
+mirrorDirectory = '/var/www/html/repo/openstack'
+mirrorURL = 'http://controller/repo/openstack'
+
+# packages the mirror was last built for, one per line
+packageListFile = mirrorDirectory + '/packages.list'
+
+repoName = 'openstack-mirror'
+repoFile = '/etc/yum.repos.d/{}.repo'.format(repoName)
+
+# priority 1 (yum-plugin-priorities) makes yum take the packages from
+# the mirror; the other repos are only used for what it doesn't have.
+# repotrack keeps the signed packages, so they are checked with the
+# keys of CentOS and of the EPEL and RDO repos set up by stage 0
+repoConfig = """[{}]
+name=Local mirror of the OpenStack packages
+baseurl={}
+enabled=1
+gpgcheck=1
+gpgkey=file:///etc/pki/rpm-gpg/RPM-GPG-KEY-CentOS-7
+       file:///etc/pki/rpm-gpg/RPM-GPG-KEY-EPEL-7
+       file:///etc/pki/rpm-gpg/RPM-GPG-KEY-RDO-Juno
+priority=1
+skip_if_unavailable=1
+metadata_expire=300
+""".format(repoName, mirrorURL)
+
+def packageSet():
+    "Sorted list of all the packages in env_config.packages"
+    names = set()
+    for roles in env_config.packages.values():
+        for roleNames in roles.values():
+            names.update(roleNames)
+    return sorted(names)
+
+########################## Deployment ########################################
+
+@roles('controller')
+def download_packages(refresh=False):
+    """
+    Download every package of the deployment, with its dependencies,
+    to the controller and make a yum repository of them
+
+    Nothing is downloaded if the mirror was already built for the same
+    package set. fab download_packages:refresh=True gets newer versions
+    """
+    names = packageSet()
+
+    current = run('cat ' + packageListFile, quiet=True)
+    if refresh in (False, 'False', 'false') and current.succeeded \
+            and current.splitlines() == names \
+            and exists(mirrorDirectory + '/repodata/repomd.xml'):
+        print blue('Mirror already has the {} packages. Nothing downloaded'.format(len(names)))
+        return
+
+    runCheck('Install the mirror tools', 'yum -y install yum-utils createrepo httpd')
+
+    # repotrack gets the whole dependency tree, whatever is installed on
+    # the controller, and skips the files that are already there
+    runCheck('Download {} packages and their dependencies'.format(len(names)),
+            'mkdir -p {0} && repotrack -a x86_64 -p {0} {1}'.format(
+                mirrorDirectory, ' '.join(names)))
+    runCheck('Build the repository metadata',
+            'createrepo --update --workers 4 ' + mirrorDirectory)
+
+    put(StringIO('\n'.join(names) + '\n'), packageListFile)
+    logging.info('Package mirror built for {} packages'.format(len(names)))
+
+@roles('controller')
+def serve_mirror():
+    runCheck('Install httpd', 'rpm -q httpd || yum -y install httpd')
+    runCheck('Enable httpd service', 'systemctl enable httpd.service')
+    runCheck('Start httpd service', 'systemctl start httpd.service')
+
+@parallel(pool_size=env_config.parallelPoolSize)
+@roles('controller','network','storage','compute')
+def use_mirror():
+    "Point yum at the mirror on the controller"
+    current = run('cat ' + repoFile, quiet=True)
+    if current.succeeded and current.splitlines() == repoConfig.splitlines():
+        print blue('{} already uses the mirror'.format(env.host))
+        return
+
+    put(StringIO(repoConfig), repoFile)
+    runCheck('Refresh the metadata of the mirror',
+            'yum --disablerepo=* --enablerepo={} clean metadata'.format(repoName))
+    printMessage('good', 'Use the package mirror on ' + env.host)
+
+@parallel(pool_size=env_config.parallelPoolSize)
+@roles('controller','network','storage','compute')
+def install_package_plan():
+    """
+    Install the packages of every component that each host needs for
+    its roles, in one yum transaction per host, on all hosts at once
+
+    The install tasks of the later stages then only check them (see
+    myLib.ensurePackages), instead of running yum once per stage
+    """
+    ensurePackages(componentPackages(), 'Install the package plan on ' + env.host)
+
+def deploy():
+    execute(download_packages)
+    execute(serve_mirror)
+    execute(use_mirror)
+    execute(install_package_plan)
+
+######################################## TDD #########################################
+
+@roles('controller')
+def mirror_content_tdd():
+    "Check that the mirror has every package of the deployment"
+    names = packageSet()
+    out = runCheck('List the packages of the mirror',
+            "repoquery --repofrompath=mirror,{} --repoid=mirror -a --qf '%{{name}}'".format(
+                mirrorDirectory), quiet=True)
+    missing = [name for name in names if name not in out.split()]
+    if missing:
+        print align_n('Not in the mirror: ' + ' '.join(missing))
+        sys.exit(1)
+    print align_y('All {} packages are in the mirror'.format(len(names)))
+
+@parallel(pool_size=env_config.parallelPoolSize)
+@roles('controller','network','storage','compute')
+def mirror_access_tdd():
+    "Check that every node can read the mirror"
+    runCheck('Read the mirror from ' + env.host,
+            'curl -sf {}/repodata/repomd.xml >/dev/null'.format(mirrorURL))
+
+def tdd():
+    execute(mirror_content_tdd)
+    execute(mirror_access_tdd)
@@ -11,7 +11,8 @@ import sys
 sys.path.append('..')
 import env_config
 from myLib import runCheck, createDatabaseScript, set_parameter
-from myLib import database_check, keystone_check, saveConfigFile
+from myLib import database_check, keystone_check, saveConfigFile, keystoneCatalog, tokenrc
+from myLib import ensurePackages, componentPackages
 
 
 ############################ Config ########################################
@@ -42,9 +43,9 @@ def setup_heat_keystone(HEAT_PASS):
     """
 
     # get credentials
-    with prefix(env_config.admin_openrc):
+    with prefix(tokenrc(env_config.admin_openrc)):
 
-        if 'heat' not in run("keystone user-list"):
+        if not keystoneCatalog().user('heat'):
             msg = 'Create user heat'
             runCheck(msg, "keystone user-create --name heat --pass {}".format(HEAT_PASS))
             msg = 'Add role of admin to user heat'
@@ -52,7 +53,7 @@ def setup_heat_keystone(HEAT_PASS):
         else:
             print blue('heat is already a user. Do nothing')
 
-        if 'heat_stack_owner' not in run("keystone role-list"):
+        if not keystoneCatalog().role('heat_stack_owner'):
             msg = "Create role heat_stack_owner"
             runCheck(msg, "keystone role-create --name heat_stack_owner")
             msg = "Add the role of heat_stack_owner to user demo"
@@ -60,25 +61,25 @@ def setup_heat_keystone(HEAT_PASS):
         else:
             print blue('heat_stack_owner is already a role. Do nothing')
 
-        if 'heat_stack_user' not in sudo("keystone role-list"):
+        if not keystoneCatalog().role('heat_stack_user'):
             msg = "Create role heat_stack_user"
             runCheck(msg, "keystone role-create --name heat_stack_user")
         else:
             print blue('heat_stack_user is already a role. Do nothing')
 
-        if 'heat' not in sudo("keystone service-list"):
+        if not keystoneCatalog().service('heat'):
             msg = 'Create service heat'
             runCheck(msg, 'keystone service-create --name heat --type orchestration --description "Orchestration"')
         else:
             print blue('heat is already a service. Do nothing')
 
-        if 'heat-cfn' not in sudo("keystone service-list"):
+        if not keystoneCatalog().service('heat-cfn'):
             msg = 'Create service heat-cfn'
             runCheck(msg, 'keystone service-create --name heat-cfn --type cloudformation --description "Orchestration"')
         else:
             print blue('heat-cfn is already a service. Do nothing')
         
-        if 'http://controller:8004' not in sudo("keystone endpoint-list"):
+        if not keystoneCatalog().hasEndpoint('http://controller:8004'):
             runCheck(msg, """keystone endpoint-create \
             --service-id $(keystone service-list | awk '/ orchestration / {print $2}') \
             --publicurl http://controller:8004/v1/%\(tenant_id\)s \
@@ -88,7 +89,7 @@ def setup_heat_keystone(HEAT_PASS):
         else:
             print blue('8004 is already an endpoint. Do nothing')
 
-        if 'http://controller:8000' not in sudo("keystone endpoint-list"):
+        if not keystoneCatalog().hasEndpoint('http://controller:8000'):
             runCheck(msg, """keystone endpoint-create \
             --service-id $(keystone service-list | awk '/ cloudformation / {print $2}') \
             --publicurl http://controller:8000/v1 \
@@ -99,8 +100,7 @@ def setup_heat_keystone(HEAT_PASS):
             print blue('8000 is already an endpoint. Do nothing')
         
 def setup_heat_config_files(HEAT_PASS, HEAT_DBPASS, RABBIT_PASS):
-    msg = 'Install packages'
-    runCheck(msg, "yum install -y openstack-heat-api openstack-heat-api-cfn openstack-heat-engine python-heatclient")
+    ensurePackages(componentPackages('heat'))
     
     set_parameter(etc_heat_config_file, 'database', 'connection', 'mysql://heat:{}@controller/heat'.format(HEAT_DBPASS))
 
@@ -158,7 +158,7 @@ def create_stack():
     Create a stack on the demo-net (assuming it exists)
     """
 
-    with prefix(env_config.demo_openrc):
+    with prefix(tokenrc(env_config.demo_openrc)):
 
         # Upload the test file to the host
         put(heat_test_file)
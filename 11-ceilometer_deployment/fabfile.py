@@ -12,6 +12,8 @@ sys.path.append('..')
 import env_config
 from myLib import runCheck, createDatabaseScript, set_parameter
 from myLib import database_check, keystone_check, run_v, align_n, align_y
+from myLib import requires, executeGraph, keystoneCatalog, registerServices
+from myLib import ensurePackages, componentPackages
 
 
 
@@ -33,51 +35,15 @@ def setup_ceilometer_keystone_on_controller():
     (b) an endpoint for the 'ceilometer' service
     """
 
-    CEILOMETER_PASS = passwd['CEILOMETER_PASS']
+    registerServices(['ceilometer'])
 
-    # get admin credentials to run the CLI commands
-    credentials = env_config.admin_openrc
-
-    with prefix(credentials):
-        # before each creation, we check a list to avoid duplicates
-
-        if 'ceilometer' not in run("keystone user-list"):
-            msg = "Create user ceilometer"
-            runCheck(msg, "keystone user-create --name ceilometer --pass {}".format(CEILOMETER_PASS))
-
-            msg = "Give the user 'ceilometer the role of admin"
-            runCheck(msg, "keystone user-role-add --user ceilometer --tenant service --role admin")
-        else:
-            print blue("User ceilometer already created. Do nothing")
-
-        if 'ceilometer' not in run("keystone service-list"):
-            msg = "Create service ceilometer"
-            runCheck(msg, "keystone service-create --name ceilometer --type metering --description 'Telemetry'")
-        else:
-            print blue("Service ceilometer already created. Do nothing")
-
-        if 'http://controller:8777' not in run("keystone endpoint-list"):
-            msg = "Create endpoint for service ceilometer"
-            runCheck(msg, "keystone endpoint-create " + \
-                    "--service-id $(keystone service-list | awk '/ceilometer/ {print $2}') " +\
-                    "--publicurl http://controller:8777 " + \
-                    "--internalurl http://controller:8777 " + \
-                    "--adminurl http://controller:8777 " + \
-                    "--region regionOne")
-        else:
-            print blue("Endpoint for service ceilometer already created. Do nothing")
-    
 @roles('controller')
 def setup_ceilometer_config_files_on_controller():
     CEILOMETER_PASS = passwd['CEILOMETER_PASS']
     ceilometer_config_file = "/etc/ceilometer/ceilometer.conf"
     RABBIT_PASS = passwd['RABBIT_PASS']
 
-    install_command = "yum install -y openstack-ceilometer-api openstack-ceilometer-collector " + \
-        "openstack-ceilometer-notification openstack-ceilometer-central openstack-ceilometer-alarm " + \
-        "python-ceilometerclient"
-    
-    run(install_command)
+    ensurePackages(componentPackages('ceilometer'))
     
 
     # we use our own from env_config in order to simplify key generation
@@ -114,7 +80,7 @@ def setup_ceilometer_config_files_on_controller():
 @roles('controller')
 def setup_mongo_on_controller():
     CONTROLLER_IP = env_config.nicDictionary['controller']['mgtIPADDR']
-    run("yum install -y mongodb-server mongodb")
+    ensurePackages(componentPackages('mongodb'))
     confFile = "/etc/mongod.conf"
 
 
@@ -146,6 +112,7 @@ def setup_mongo_on_controller():
     runCheck('Restart mongo','systemctl restart mongod.service')
     
 
+@requires(setup_mongo_on_controller)
 @roles('controller')
 def create_mongo_ceilometer_db_on_controller():
     CEILOMETER_PASS = passwd['CEILOMETER_PASS']
@@ -159,6 +126,9 @@ def create_mongo_ceilometer_db_on_controller():
               """  })'  """ 
     runCheck('setup ceilometer db in mongo', command) 
 
+@requires(create_mongo_ceilometer_db_on_controller,
+        setup_ceilometer_keystone_on_controller,
+        setup_ceilometer_config_files_on_controller)
 @roles('controller')
 def start_ceilometer_services_on_controller():
     ceilometer_services = "openstack-ceilometer-api.service openstack-ceilometer-notification.service " + \
@@ -207,7 +177,7 @@ def configure_object_storage():
     with prefix(credentials):
         # before each creation, we check a list to avoid duplicates
 
-        if 'Reseller' in run("keystone role-list"):
+        if keystoneCatalog().role('ResellerAdmin'):
             print(blue("ResellerAdmin already set"))
         else:
             runCheck('','keystone role-create --name ResellerAdmin')
@@ -226,13 +196,15 @@ def configure_object_storage():
     
 
 
+@parallel(pool_size=env_config.parallelPoolSize)
 @roles('compute')
 def install_packages_on_compute():
     # Install packages
-    msg = "Install OpenStack Ceilometer packages"
-    runCheck(msg, "yum install -y openstack-ceilometer-compute python-ceilometerclient python-pecan")
+    ensurePackages(componentPackages('ceilometer'), "Install OpenStack Ceilometer packages")
    
 
+@requires(install_packages_on_compute)
+@parallel(pool_size=env_config.parallelPoolSize)
 @roles('compute')
 def install_and_configure_ceilometer_on_compute():
 
@@ -267,6 +239,7 @@ def install_and_configure_ceilometer_on_compute():
 
 
 
+@parallel(pool_size=env_config.parallelPoolSize)
 @roles('compute')
 def configure_notifications_on_compute():
     conf_file = "/etc/nova/nova.conf" 
@@ -276,6 +249,9 @@ def configure_notifications_on_compute():
     set_parameter(conf_file, 'DEFAULT','notify_on_state_change', 'vm_and_task_state')
     set_parameter(conf_file, 'DEFAULT','notification_driver', 'messagingv2')
 
+@requires(install_and_configure_ceilometer_on_compute,
+        setup_ceilometer_keystone_on_controller)
+@parallel(pool_size=env_config.parallelPoolSize)
 @roles('compute')
 def start_telemetry_on_compute():
     runCheck("enable telemetry","systemctl enable openstack-ceilometer-compute.service")
@@ -283,6 +259,8 @@ def start_telemetry_on_compute():
     #runCheck("restart telemetry","systemctl restart openstack-ceilometer-compute.service")
 
 
+@requires(configure_notifications_on_compute, start_telemetry_on_compute)
+@parallel(pool_size=env_config.parallelPoolSize)
 @roles('compute')
 def restart_nova_on_compute():
     run("systemctl restart openstack-nova-compute.service")
@@ -292,32 +270,37 @@ def restart_nova_on_compute():
 
 def deploy():
 
-    ###### controller portion
+    # each task starts as soon as the tasks it requires are done,
+    # so the controller and compute portions overlap
+    executeGraph([
 
-    execute(setup_mongo_on_controller)
-    execute(create_mongo_ceilometer_db_on_controller)
-    execute(setup_ceilometer_keystone_on_controller)
-    execute(setup_ceilometer_config_files_on_controller)
-    execute(start_ceilometer_services_on_controller)
+        ###### controller portion
 
+        setup_mongo_on_controller,
+        create_mongo_ceilometer_db_on_controller,
+        setup_ceilometer_keystone_on_controller,
+        setup_ceilometer_config_files_on_controller,
+        start_ceilometer_services_on_controller,
 
-    ###### compute portion
 
-    execute(install_packages_on_compute)
-    execute(install_and_configure_ceilometer_on_compute)
-    execute(configure_notifications_on_compute)
-    execute(start_telemetry_on_compute)
-    execute(restart_nova_on_compute)
-    
+        ###### compute portion
+
+        install_packages_on_compute,
+        install_and_configure_ceilometer_on_compute,
+        configure_notifications_on_compute,
+        start_telemetry_on_compute,
+        restart_nova_on_compute,
+
 
-    ###### configure image service
-    execute(configure_image_service)
+        ###### configure image service
+        configure_image_service,
 
-    ###### configure block service
-    execute(configure_block_storage)
+        ###### configure block service
+        configure_block_storage,
 
-    ###### configure object service ### left out for now
-    #execute(configure_object_storage)
+        ###### configure object service ### left out for now
+        #configure_object_storage,
+        ])
     
 
 
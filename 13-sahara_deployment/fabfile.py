@@ -9,7 +9,10 @@ import string
 
 import sys
 sys.path.append('../global_config_files')
+sys.path.append('..')
 import env_config
+from myLib import keystoneCatalog, invalidateKeystoneCatalog, createDatabaseScript
+from myLib import ensurePackages, componentPackages
 
 
 logging.basicConfig(filename='/tmp/juno2015.log',level=logging.DEBUG, format='%(asctime)s %(message)s')
@@ -51,9 +54,7 @@ def set_parameter(config_file, section, parameter, value):
 
 
 def setup_sahara_database(SAHARA_DBPASS):
-    mysql_commands = "CREATE DATABASE IF NOT EXISTS sahara;"
-    mysql_commands = mysql_commands + " GRANT ALL PRIVILEGES ON sahara.* TO 'sahara'@'localhost' IDENTIFIED BY '{}';".format(SAHARA_DBPASS)
-    mysql_commands = mysql_commands + " GRANT ALL PRIVILEGES ON sahara.* TO 'sahara'@'%' IDENTIFIED BY '{}';".format(SAHARA_DBPASS)
+    mysql_commands = createDatabaseScript('sahara', SAHARA_DBPASS)
 
     
     sudo_log('echo "{}" | mysql -u root -p{}'.format(mysql_commands, env_config.passwd['ROOT_SECRET']))
@@ -69,17 +70,19 @@ def setup_sahara_keystone(SAHARA_PASS):
         #sudo_log("keystone role-create --name sahara_stack_owner")
         #sudo_log("keystone user-role-add --user demo --tenant demo --role sahara_stack_owner")
         #sudo_log("keystone role-create --name sahara_stack_user")
-        if 'sahara' not in sudo_log('keystone service-list'):
+        if not keystoneCatalog().service('sahara'):
             sudo_log('keystone service-create --name sahara --type data_processing --description "Data processing service"')
+            invalidateKeystoneCatalog()
             #sudo_log('keystone service-create --name sahara-cfn --type cloudformation --description "Orchestration"')
             
-        if '8386' not in sudo_log('keystone endpoint-list'):
+        if not keystoneCatalog().hasEndpoint('http://controller:8386'):
             sudo_log("""keystone endpoint-create \
                 --service-id $(keystone service-list | awk '/ sahara / {print $2}') \
                 --publicurl http://controller:8386/v1.1/%\(tenant_id\)s \
                 --internalurl http://controller:8386/v1.1/%\(tenant_id\)s \
                 --adminurl http://controller:8386/v1.1/%\(tenant_id\)s \
                 --region regionOne""")
+            invalidateKeystoneCatalog()
 
         #sudo_log("""keystone endpoint-create \
         #--service-id $(keystone service-list | awk '/ cloudformation / {print $2}') \
@@ -89,7 +92,7 @@ def setup_sahara_keystone(SAHARA_PASS):
         #--region regionOne""")
         
 def setup_sahara_config_files(SAHARA_PASS, SAHARA_DBPASS, RABBIT_PASS):
-    sudo_log("yum install -y openstack-sahara python-saharaclient")
+    ensurePackages(componentPackages('sahara'))
     
     set_parameter(etc_sahara_config_file, 'database', 'connection', 'mysql://sahara:{}@controller/sahara'.format(SAHARA_DBPASS))
 
@@ -142,7 +145,7 @@ def start_sahara_services():
 
 def download_packages():
     # make sure we have crudini
-    sudo_log('yum install -y crudini')
+    ensurePackages(['crudini'])
    
 @roles('controller')
 def setup_sahara():
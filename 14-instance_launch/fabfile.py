@@ -4,6 +4,12 @@ from fabric.decorators import with_settings
 from fabric.colors import green, red, blue
 import logging
 import time
+import datetime
+import json
+import math
+import os
+import multiprocessing
+from fabric.state import connections
 
 import sys
 sys.path.append('..')
@@ -15,6 +21,43 @@ import myLib
 env.roledefs = env_config.roledefs
 runCheck = myLib.runCheck
 
+# Polling of wait_for: first interval, growth factor and longest
+# interval between two list calls, in seconds
+pollInterval = 2
+pollBackoff = 1.5
+pollMaxInterval = 30
+
+# How long wait_for waits before giving up, in seconds. Building a
+# windows volume can take about 15 minutes
+waitDeadline = 40 * 60
+
+# Stages of an instance launch, in order, and how many images can be in
+# each stage at once in launch_pipeline. Floating ips are given one at a
+# time, since two launches could otherwise pick the same free address
+launchStages = ['download', 'image', 'volume', 'boot', 'floating ip']
+launchLimits = {
+        'download' : 2,
+        'image' : 2,
+        'volume' : 3,
+        'boot' : 3,
+        'floating ip' : 1,
+        }
+
+# Images the benchmark task can launch
+benchmarkImages = {
+        'centos7Minimal' : 'http://129.128.208.164/images/centos7Minimal.qcow2',
+        'windows7' : 'http://129.128.208.164/images/windows7.qcow2',
+        'w8' : 'http://129.128.208.164/images/w8.qcow2',
+        'cirros' : 'http://129.128.208.164/images/cirros-0.3.3-x86_64-disk.img',
+        }
+
+# Phases timed by the benchmark task, and how often it polls while
+# timing them, in seconds. Instances and volumes are deleted after each
+# run when benchmarkCleanup is set
+benchmarkPhases = ['volume', 'scheduling', 'spawning', 'active', 'floating ip', 'total']
+benchmarkPollInterval = 1
+benchmarkCleanup = True
+
 ################################## Deployment ########################################
 
 def key_exists():
@@ -35,7 +78,7 @@ def generate_key(keyName):
         
     
 def image_active(image):
-    with prefix(env_config.admin_openrc):
+    with prefix(myLib.tokenrc(env_config.admin_openrc)):
         imageStatus = runCheck("check if %s exists" % image, "glance image-list | awk '/" + image + "/ {print $12}'")
         
         if imageStatus == "active":
@@ -49,17 +92,15 @@ def delete_image(image_to_delete):
     # assumes only one image with name
     # image_to_delete exists
     # otherwise, functions needs image id
-    with prefix(env_config.admin_openrc):
+    with prefix(myLib.tokenrc(env_config.admin_openrc)):
         runCheck("delete %s" % image,"glance delete %s" % image_to_delete)
 
 def get_iso(url, imageFile):
-    msg = 'Retrieve instance image'
-    run("mkdir -p /tmp/images")
-    with settings(warn_only=True):
-        if run("ls /tmp/images | grep %s" % imageFile, quiet=True) == '':
-            runCheck(msg, "wget -P /tmp/images " + url)
-            runCheck("Check to see if file is in its folder", 
-                        "ls /tmp/images | grep %s" % imageFile)
+    # put the image in /tmp/images, downloading it
+    # only if it isn't in the image cache already
+    myLib.cachedImage(url)
+    runCheck("Check to see if file is in its folder", 
+                "ls /tmp/images | grep %s" % imageFile)
 
 
 def create_image(imageName, imageFile, diskFormat):
@@ -122,26 +163,61 @@ def already_booted(instanceName):
         print(blue("already booted"))
         return True
 
-def wait_to_finish(elementType, listCommand, elementName, finishWord):
-    print(blue("Waiting for %s to finish" % elementType))
-    with settings(warn_only=True):
-        msg = 'Create %s' % elementType
-        finishCheck = run("%s | grep %s | grep -i %s" % (listCommand, elementName, finishWord), quiet=True) 
-        while finishCheck == '':
-            finishCheck = run("%s | grep %s | grep -i %s" % (listCommand, elementName, finishWord), quiet=True) 
-            time = run('date +"%Y-%m-%d %H:%M:%S"',quiet=True)
-            errorCheck = run("%s | grep %s | grep -i ERROR" % (listCommand, elementName), quiet=True) 
-            if errorCheck != '':
+def wait_for(elementType, listCommand, finishWord, names, deadline=None, maxInterval=None):
+    """
+    Wait until all the named resources reach finishWord in listCommand
+
+    Each poll is a single listCommand call, whatever the number of
+    resources. The time between polls starts at pollInterval and grows
+    by pollBackoff up to pollMaxInterval (or maxInterval). Exits if a
+    resource goes into ERROR or if they aren't all done after deadline
+    seconds (waitDeadline by default)
+    """
+    print(blue("Waiting for %s %s to finish" % (elementType, ', '.join(names))))
+    msg = 'Create %s %s' % (elementType, ', '.join(names))
+    myLib.markLogs()
+
+    pending = set(names)
+    maxInterval = maxInterval or pollMaxInterval
+    interval = min(pollInterval, maxInterval)
+    start = time.time()
+    deadline = deadline or waitDeadline
+
+    while True:
+        output = run(listCommand, quiet=True, warn_only=True)
+
+        for name in list(pending):
+            rows = [line for line in output.splitlines()
+                    if name in [field.strip() for field in line.split('|')]]
+            if any('error' in row.lower() for row in rows):
                 myLib.printMessage('oops',msg)
-                errormsg = 'Failure on: ' + msg
-                logging.error(errormsg)
-                logging.error(errorCheck)
-                myLib.checkLog(time)
-                sys.exit("%s couldn't finish. Check logs above" % elementType)
-        myLib.printMessage('good',msg)
-        logging.info('Success on: ' + msg)
-        logging.debug(finishCheck)
+                logging.error('Failure on: ' + msg)
+                logging.error('\n'.join(rows))
+                myLib.checkLog()
+                sys.exit("%s %s couldn't finish. Check logs above" % (elementType, name))
+            if any(finishWord.lower() in row.lower() for row in rows):
+                print(green("%s %s done after %d s" % (elementType, name, time.time() - start)))
+                pending.discard(name)
+
+        if not pending:
+            break
+
+        if time.time() - start > deadline:
+            myLib.printMessage('oops',msg)
+            logging.error('Timeout on: ' + msg)
+            myLib.checkLog()
+            sys.exit("%s %s not done after %d s" % (elementType, ', '.join(sorted(pending)), deadline))
+
+        time.sleep(interval)
+        interval = min(interval * pollBackoff, maxInterval)
+
+    myLib.dropLogCursor()
+    myLib.printMessage('good',msg)
+    logging.info('Success on: ' + msg)
     print(green("%s done!" % elementType))
+
+def wait_to_finish(elementType, listCommand, elementName, finishWord):
+    wait_for(elementType, listCommand, finishWord, [elementName])
    
 #def boot_vm(flavorSize, imageName, keyName, instanceName):
 def boot_from_volume(flavorSize, volumeName, keyName, instanceName):
@@ -153,12 +229,16 @@ def boot_from_volume(flavorSize, volumeName, keyName, instanceName):
     if volumeID != '':
         wait_to_finish('volume', 'cinder list', volumeName, 'available')
  
+    request_boot_from_volume(flavorSize, volumeID, keyName, instanceName)
+    wait_to_finish('instance', 'nova list', instanceName, 'active')
+
+def request_boot_from_volume(flavorSize, volumeID, keyName, instanceName):
+    "Ask nova to boot an instance from a volume, without waiting for it"
     netid = run("neutron net-list | awk '/demo-net/ {print $2}'")
     #run("nova boot --flavor m1.%s --image %s " % (flavorSize, imageName) + \
     run("nova boot --flavor m1.%s --boot-volume %s " % (flavorSize, volumeID) + \
     "--nic net-id=%s " % netid + \
     "--security-group default --key-name %s %s" % (keyName, instanceName))
-    wait_to_finish('instance', 'nova list', instanceName, 'active')
        
 #def boot_vm(flavorSize, imageName, keyName, instanceName):
 def boot_from_image(volumeName, flavorSize, imageName, keyName, instanceName):
@@ -179,7 +259,7 @@ def boot_from_image(volumeName, flavorSize, imageName, keyName, instanceName):
 
 @roles('controller')
 def security_rules_set_on_demo():
-    with prefix(env_config.demo_openrc):
+    with prefix(myLib.tokenrc(env_config.demo_openrc)):
         output = runCheck("check for icmp and tcp rule","nova secgroup-list-rules default")
         if all(rule in output for rule in ['tcp', 'icmp']):
             print(blue("rules for icmp and tcp already set"))
@@ -189,33 +269,48 @@ def security_rules_set_on_demo():
 
 @roles('controller')
 def adjust_security():
-    with prefix(env_config.demo_openrc):
+    with prefix(myLib.tokenrc(env_config.demo_openrc)):
         if security_rules_set_on_demo:
             return
         else:
             runCheck("Edit ICMP security rules", "nova secgroup-add-rule default icmp -1 -1 0.0.0.0/0")
             runCheck("Edit TCP security rules", "nova secgroup-add-rule default tcp 22 22 0.0.0.0/0")
 
+def allocate_floating_ip():
+    """
+    Address of a new floating ip, or of a free one if the quota is used
+    up. Empty if there is neither
+    """
+    output = run("neutron floatingip-create ext-net", warn_only=True)
+    if "Conflict" in output:
+        print(blue("floating ip cant be allocated"))
+        floating_ip = run("nova floating-ip-list | awk '/ - / {print $2}' | head -1", warn_only=True)
+        if floating_ip == "":
+            print(blue("no free unallocated ips either, Exiting"))
+        return floating_ip
+
+    for line in output.splitlines():
+        fields = [field.strip() for field in line.strip().strip('|').split('|')]
+        if len(fields) == 2 and fields[0] == 'floating_ip_address':
+            return fields[1]
+    return ""
+
 def give_floating_ip(instanceName):
+    """
+    Associate a floating ip with an instance, if it has none yet
+
+    Returns the address, empty if there was no floating ip to give
+    """
     # check if instance already has a floating ip
     if "," in runCheck("check if instance has floating ip", " nova list | awk '/%s/ {print $12}' " % instanceName):
         print(blue("floating ip for %s already exists" % instanceName))
-        return
+        return ""
     
-    floating_ip = ""
-    if  "Conflict" in run("neutron floatingip-create ext-net", warn_only=True):
-        print(blue("floating ip cant be allocated"))
-        if run("nova floating-ip-list | awk '/ - / {print $2}'", warn_only=True) == "":
-            print(blue("no free unallocated ips either, Exiting"))
-            return
-        else:
-            floating_ip = run("nova floating-ip-list | awk '/ - / {print $2}' | head -1")
-    
-    else:
-        floating_ip = run(" neutron floatingip-create ext-net | awk '/floating_ip_address/ {print $4}'")
-    
-    runCheck("Assign floating ip", "nova floating-ip-associate %s " % instanceName + \
-            " %s" %floating_ip)
+    floating_ip = allocate_floating_ip()
+    if floating_ip:
+        runCheck("Assign floating ip", "nova floating-ip-associate %s " % instanceName + \
+                " %s" %floating_ip)
+    return floating_ip
 
 def attach_volume(volumeName, instanceName):
     wait_to_finish('instance', 'nova list', instanceName, 'active')
@@ -240,14 +335,14 @@ def create_image_from_volume(volumeName, volumeImageName):
 
 @roles('controller')
 def deploy_cirros():
-    with prefix(env_config.admin_openrc):
+    with prefix(myLib.tokenrc(env_config.admin_openrc)):
         get_iso('http://129.128.208.164/images/cirros-0.3.3-x86_64-disk.img',
                 'cirros-0.3.3-x86_64-disk.img')
         create_image(
            'cirros-image0',
            'cirros-0.3.3-x86_64-disk.img',
            'qcow2')
-    with prefix(env_config.demo_openrc):
+    with prefix(myLib.tokenrc(env_config.demo_openrc)):
         generate_key('demo-key')
         create_bootable_volume('cirros-image0', '10', 'cirros-volume0')
         boot_from_volume('small', 'cirros-volume0', 'demo-key', 'demo-instance0')
@@ -260,14 +355,14 @@ def deploy_cirros():
 def deploy_windows7():
     # preconfigured .qcow2 must be present in /tmp/images
     # with name matching the one used below
-    with prefix(env_config.admin_openrc):
+    with prefix(myLib.tokenrc(env_config.admin_openrc)):
         get_iso('http://129.128.208.164/images/windows7.qcow2',
                 'windows7.qcow2')
         create_image(
             'windows7-image0',
             'windows7.qcow2',
             'qcow2')
-    with prefix(env_config.demo_openrc):
+    with prefix(myLib.tokenrc(env_config.demo_openrc)):
         generate_key('demo-key')
         create_bootable_volume('windows7-image0', '50', 'windows7-volume0')
         boot_from_volume('large', 'windows7-volume0', 'demo-key', 'windows7-instance0')
@@ -275,7 +370,7 @@ def deploy_windows7():
       
 @roles('controller')
 def deploy_ubuntu_start():
-    with prefix(env_config.admin_openrc):
+    with prefix(myLib.tokenrc(env_config.admin_openrc)):
 #        get_iso('http://129.128.208.164/images/ubuntu-14.04.3-desktop-amd64.iso',
         get_iso('http://releases.ubuntu.com/14.04.2/ubuntu-14.04.2-desktop-amd64.iso',
                 'ubuntu-14.04.2-desktop-amd64.iso')
@@ -283,7 +378,7 @@ def deploy_ubuntu_start():
             'ubuntu-test0',
             'ubuntu-14.04.2-desktop-amd64.iso',
             'qcow2')
-    with prefix(env_config.demo_openrc):
+    with prefix(myLib.tokenrc(env_config.demo_openrc)):
         generate_key('demo-key')
         create_volume('10', 'ubuntu-volume0')
         boot_from_image('ubuntu-volume0', 
@@ -297,7 +392,7 @@ def deploy_ubuntu_start():
 
 @roles('controller')
 def deploy_ubuntu_end():
-     with prefix(env_config.demo_openrc):
+     with prefix(myLib.tokenrc(env_config.demo_openrc)):
         runCheck('Get rid of old instance', 'nova delete ubuntu-instance0')
         runCheck('Make volume bootable', 'cinder set-bootable ubuntu-volume0 true')
         create_image_from_volume('ubuntu-volume0', 'ubuntu-final-image') 
@@ -305,19 +400,10 @@ def deploy_ubuntu_end():
         boot_from_volume('small', 'ubuntu-bootable-volume1', 'demo-key', 'ubuntu-volume-instance1')
 
    
-@roles('controller')
-def boot_instance(url):
-    # function purpose:
-    # 1.) gets preconfigured qcow2 file from url location
-    #
-    # 2.) creates an image from that downloaded file
-    #
-    # 3.) creates a bootable volume from image 
-    #
-    # 4.) generates key, boots from bootable volume 
-    # and attaches floating ip
-    
-    instance_suffix = runCheck('get instance name suffix','echo "$(date +%H%M%S)"')
+def instance_plan(url, instance_suffix):
+    """
+    Names, format, size and flavor used to launch the image at url
+    """
     image_location = url
     image_filename = image_location.split('/')[-1]
     image_name = image_filename.split('.')[0] 
@@ -344,30 +430,319 @@ def boot_instance(url):
     else:
         disk_size = '10'
         flavor = 'medium'
-        
 
-    with prefix(env_config.admin_openrc):        
-        get_iso(image_location, image_filename)
-        create_image(
-            image_name,
-            image_filename,
-            image_format)
-    with prefix(env_config.demo_openrc):
-        generate_key(key_name)
-        create_bootable_volume(image_name, disk_size, volume_name)
-        boot_from_volume(flavor, volume_name, key_name, instance_name)
-        give_floating_ip(instance_name)
+    return {
+            'image_location': image_location,
+            'image_filename': image_filename,
+            'image_name': image_name,
+            'image_format': image_format,
+            'instance_name': instance_name,
+            'volume_name': volume_name,
+            'key_name': key_name,
+            'disk_size': disk_size,
+            'flavor': flavor,
+            }
+
+def launch_stage(plan, stage):
+    "Run one of launchStages for an instance_plan"
+    if stage == 'download':
+        with prefix(myLib.tokenrc(env_config.admin_openrc)):        
+            get_iso(plan['image_location'], plan['image_filename'])
+    elif stage == 'image':
+        with prefix(myLib.tokenrc(env_config.admin_openrc)):        
+            create_image(
+                plan['image_name'],
+                plan['image_filename'],
+                plan['image_format'])
+    elif stage == 'volume':
+        with prefix(myLib.tokenrc(env_config.demo_openrc)):
+            create_bootable_volume(plan['image_name'], plan['disk_size'], plan['volume_name'])
+            wait_to_finish('volume', 'cinder list', plan['volume_name'], 'available')
+    elif stage == 'boot':
+        with prefix(myLib.tokenrc(env_config.demo_openrc)):
+            boot_from_volume(plan['flavor'], plan['volume_name'], plan['key_name'], plan['instance_name'])
+    elif stage == 'floating ip':
+        with prefix(myLib.tokenrc(env_config.demo_openrc)):
+            give_floating_ip(plan['instance_name'])
+
+@roles('controller')
+def boot_instance(url):
+    # function purpose:
+    # 1.) gets preconfigured qcow2 file from url location
+    #
+    # 2.) creates an image from that downloaded file
+    #
+    # 3.) creates a bootable volume from image 
+    #
+    # 4.) generates key, boots from bootable volume 
+    # and attaches floating ip
+    
+    instance_suffix = runCheck('get instance name suffix','echo "$(date +%H%M%S)"')
+    plan = instance_plan(url, instance_suffix)
+
+    with prefix(myLib.tokenrc(env_config.demo_openrc)):
+        generate_key(plan['key_name'])
+
+    for stage in launchStages:
+        launch_stage(plan, stage)
+
+@roles('controller')
+def launch_pipeline(*urls):
+    """
+    Launch an instance for each image url, all at the same time
+
+    Each image goes through launchStages in its own process, so the
+    download of an image, the upload of another and the volume build
+    of a third overlap. launchLimits caps how many images are in each
+    stage at once. The time spent in each stage is printed at the end
+    """
+    instance_suffix = runCheck('get instance name suffix','echo "$(date +%H%M%S)"')
+    plans = [instance_plan(url, instance_suffix) for url in urls]
+
+    with prefix(myLib.tokenrc(env_config.demo_openrc)):
+        generate_key('demo-key')
+
+    slots = dict((stage, multiprocessing.BoundedSemaphore(launchLimits[stage]))
+            for stage in launchStages)
+    timings = multiprocessing.Queue()
+
+    def launch(plan):
+        # the parent's SSH connections can't be shared
+        connections.clear()
+        for stage in launchStages:
+            queued = time.time()
+            with slots[stage]:
+                started = time.time()
+                launch_stage(plan, stage)
+                timings.put((plan['image_name'], stage, started - queued, time.time() - started))
+
+    processes = [multiprocessing.Process(target=launch, args=(plan,)) for plan in plans]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    times = {}
+    while not timings.empty():
+        image, stage, waited, took = timings.get()
+        times[image, stage] = (waited, took)
+
+    print "\nTime per stage, in seconds (waiting for a slot in parentheses):"
+    print "  %-20s" % 'image' + ''.join("%16s" % stage for stage in launchStages)
+    for plan in plans:
+        cells = []
+        for stage in launchStages:
+            if (plan['image_name'], stage) in times:
+                cells.append("%8.1f (%5.1f)" % times[plan['image_name'], stage][::-1])
+            else:
+                cells.append("%16s" % '-')
+        print "  %-20s" % plan['image_name'] + ''.join("%16s" % cell for cell in cells)
+    print
+
+    failed = [plan['image_name'] for plan, process in zip(plans, processes) if process.exitcode]
+    if failed:
+        sys.exit("Couldn't launch " + ', '.join(failed))
+
+def nova_states(instanceName, deadline=None):
+    """
+    Poll nova list until instanceName is ACTIVE
+
+    Returns the time at which each task state (scheduling,
+    block_device_mapping, spawning...) and ACTIVE were first seen
+    """
+    seen = {}
+    start = time.time()
+    deadline = deadline or waitDeadline
+
+    while 'ACTIVE' not in seen:
+        output = run('nova list', quiet=True, warn_only=True)
+        header = None
+        for line in output.splitlines():
+            cells = [cell.strip() for cell in line.strip().strip('|').split('|')]
+            if 'Task State' in cells:
+                header = cells
+            elif header and len(cells) == len(header):
+                row = dict(zip(header, cells))
+                if row['Name'] != instanceName:
+                    continue
+                if row['Status'] == 'ERROR':
+                    sys.exit("Instance %s went into ERROR" % instanceName)
+                now = time.time()
+                seen.setdefault(row['Task State'], now)
+                if row['Status'] == 'ACTIVE':
+                    seen.setdefault('ACTIVE', now)
+
+        if 'ACTIVE' not in seen:
+            if time.time() - start > deadline:
+                sys.exit("Instance %s not active after %d s" % (instanceName, deadline))
+            time.sleep(benchmarkPollInterval)
+
+    return seen
+
+def benchmark_run(plan, flavor, run_number, floatingLock):
+    """
+    Launch one instance from a prepared image, timing each phase
+
+    floatingLock is held while a floating ip is picked and associated,
+    so that runs side by side don't pick the same free one. The
+    instance, its volume and its floating ip are deleted at the end,
+    even if the run fails, unless benchmarkCleanup is off
+
+    Returns the time of each phase, in seconds
+    """
+    name = '%s-%s-%d-%s' % (plan['image_name'], flavor, run_number, plan['suffix'])
+    volumeName = 'bench-volume-' + name
+    instanceName = 'bench-instance-' + name
+    phases = {}
+    floating_ip = ""
+
+    with prefix(myLib.tokenrc(env_config.demo_openrc)):
+        try:
+            start = time.time()
+            create_bootable_volume(plan['image_name'], plan['disk_size'], volumeName)
+            wait_for('volume', 'cinder list', 'available', [volumeName],
+                    maxInterval=benchmarkPollInterval)
+            phases['volume'] = time.time() - start
+
+            volumeID = run("cinder list | awk '/ %s / {print $2}'" % volumeName)
+            booted = time.time()
+            request_boot_from_volume(flavor, volumeID, plan['key_name'], instanceName)
+            seen = nova_states(instanceName)
+            placed = min([t for state, t in seen.items() if state not in ['scheduling', '-']])
+            phases['scheduling'] = placed - booted
+            phases['spawning'] = seen['ACTIVE'] - placed
+            phases['active'] = seen['ACTIVE'] - booted
+
+            started = time.time()
+            with floatingLock:
+                floating_ip = allocate_floating_ip()
+                if floating_ip:
+                    runCheck("Assign floating ip",
+                            "nova floating-ip-associate %s %s" % (instanceName, floating_ip))
+            phases['floating ip'] = time.time() - started
+            phases['total'] = time.time() - start
+
+        finally:
+            if benchmarkCleanup:
+                run("nova delete %s" % instanceName, quiet=True)
+                if floating_ip:
+                    run("neutron floatingip-delete $(neutron floatingip-list | awk '/ %s / {print $2}')"
+                            % floating_ip, quiet=True)
+                # the volume can only be deleted once the instance let it go
+                run("for i in $(seq 60); do cinder delete %s && break; sleep 5; done" % volumeName,
+                        quiet=True)
+
+    return phases
+
+def percentile(values, p):
+    "Nearest-rank percentile of a list of numbers"
+    values = sorted(values)
+    return values[max(int(math.ceil(p / 100.0 * len(values))) - 1, 0)]
+
+@roles('controller')
+def benchmark(images='centos7Minimal', flavors='small', count='3', jobs='2', results=None):
+    """
+    Measure how long it takes to get instances running
+
+    Launches count instances of each image and flavor (names separated
+    by ';', images from benchmarkImages), jobs at a time, and records
+    how long each phase takes: image (download and glance upload, once
+    per image), volume, scheduling, spawning, active (from the boot
+    request) and floating ip. The runs and the p50/p95/p99 of each
+    phase are written to results (benchmark-<date>.json by default)
+
+        fab benchmark:images='centos7Minimal;w8',flavors='small;medium',count=5,jobs=3
+    """
+    images = images.split(';')
+    flavors = flavors.split(';')
+    count = int(count)
+    jobs = int(jobs)
+    results = results or datetime.datetime.now().strftime('benchmark-%Y%m%d-%H%M%S.json')
+
+    execute(adjust_security)
+
+    suffix = runCheck('get instance name suffix','echo "$(date +%H%M%S)"')
+    plans = {}
+    imageTimes = {}
+    for image in images:
+        plans[image] = instance_plan(benchmarkImages[image], suffix)
+        plans[image]['suffix'] = suffix
+        start = time.time()
+        launch_stage(plans[image], 'download')
+        launch_stage(plans[image], 'image')
+        imageTimes[image] = time.time() - start
+
+    with prefix(myLib.tokenrc(env_config.demo_openrc)):
+        generate_key('demo-key')
+
+    slots = multiprocessing.BoundedSemaphore(jobs)
+    floatingLock = multiprocessing.Lock()
+    queue = multiprocessing.Queue()
+
+    def launch(image, flavor, run_number):
+        # the parent's SSH connections can't be shared
+        connections.clear()
+        with slots:
+            queue.put((image, flavor, run_number,
+                benchmark_run(plans[image], flavor, run_number, floatingLock)))
+
+    processes = []
+    for image in images:
+        for flavor in flavors:
+            for run_number in range(count):
+                process = multiprocessing.Process(target=launch, args=(image, flavor, run_number))
+                process.start()
+                processes.append(process)
+    for process in processes:
+        process.join()
+
+    runs = []
+    while not queue.empty():
+        image, flavor, run_number, phases = queue.get()
+        runs.append({'image': image, 'flavor': flavor, 'run': run_number, 'phases': phases})
+
+    summary = {}
+    print "\n%-30s %-12s %8s %8s %8s" % ('image/flavor', 'phase', 'p50', 'p95', 'p99')
+    for image in images:
+        for flavor in flavors:
+            key = '%s/%s' % (image, flavor)
+            summary[key] = {}
+            done = [r['phases'] for r in runs if r['image'] == image and r['flavor'] == flavor]
+            for phase in benchmarkPhases:
+                values = [p[phase] for p in done if phase in p]
+                if not values:
+                    continue
+                summary[key][phase] = dict(('p%d' % p, percentile(values, p)) for p in [50, 95, 99])
+                summary[key][phase]['runs'] = len(values)
+                print "%-30s %-12s %8.1f %8.1f %8.1f" % ((key, phase) +
+                        tuple(summary[key][phase]['p%d' % p] for p in [50, 95, 99]))
+    print
+
+    with open(results, 'w') as f:
+        json.dump({
+            'date': datetime.datetime.now().isoformat(),
+            'count': count,
+            'jobs': jobs,
+            'failed runs': len(processes) - len(runs),
+            'image': imageTimes,
+            'runs': runs,
+            'summary': summary,
+            }, f, indent=1, sort_keys=True)
+    print green("Benchmark results written to " + os.path.abspath(results))
+
+    if len(runs) < len(processes):
+        print red("%d of %d runs failed" % (len(processes) - len(runs), len(processes)))
 
 @roles('controller')
 def deploy_centos_start():
-    with prefix(env_config.admin_openrc):
+    with prefix(myLib.tokenrc(env_config.admin_openrc)):
         get_iso('http://129.128.208.164/images/CentOS-7-x86_64-Minimal-1503-01.iso',
                 'CentOS-7-x86_64-Minimal-1503-01.iso') 
         create_image(
             'centos-7-image',
             'CentOS-7-x86_64-Minimal-1503-01.iso',
             'iso')
-    with prefix(env_config.demo_openrc):
+    with prefix(myLib.tokenrc(env_config.demo_openrc)):
         generate_key('demo-key')
         create_volume('10', 'centos-7-volume')
         boot_from_image('centos-7-volume', 
@@ -379,7 +754,7 @@ def deploy_centos_start():
     
 @roles('controller')
 def deploy_centos_end():
-    with prefix(env_config.demo_openrc):
+    with prefix(myLib.tokenrc(env_config.demo_openrc)):
         runCheck('Get rid of old instance', 'nova delete centos-instance0')
         runCheck('Make volume bootable', 'cinder set-bootable centos-7-volume true')
         boot_from_volume('small', 'centos-7-volume', 'demo-key', 'centos-volume-instance')
@@ -391,9 +766,7 @@ def deploy():
 
     execute(adjust_security)
 
-    execute(boot_instance, windows8_location)
-    execute(boot_instance, centos7Minimal_location)
-    execute(boot_instance, windows7_location)
+    execute(launch_pipeline, windows8_location, centos7Minimal_location, windows7_location)
 
 def launchCentos7():	
     execute(adjust_security)
@@ -416,9 +789,9 @@ def launchCirros():
     execute(boot_instance, cirros_location)
 
 def destroy_stuff(imageName, volumeName, instanceName):
-    with prefix(env_config.admin_openrc):
+    with prefix(myLib.tokenrc(env_config.admin_openrc)):
         runCheck("Delete image", "nova image-delete %s" % imageName)
-    with prefix(env_config.demo_openrc):
+    with prefix(myLib.tokenrc(env_config.demo_openrc)):
         runCheck("Delete instance", "nova delete %s" % instanceName)
         volumeID = run("nova volume-list | grep '%s' | awk '{print $2}'" % volumeName)
         runCheck("Delete volume", "cinder delete %s" % volumeID)
@@ -11,6 +11,7 @@ import logging
 import sys
 sys.path.append('..')
 from myLib import runCheck, saveConfigFile, printMessage
+from myLib import ensurePackages, componentPackages
 import env_config
 
 ############################### Config ########################################
@@ -22,8 +23,7 @@ passwd = env_config.passwd
 
 @roles('controller')
 def installRabbitMQ():
-    msg= "install rabbitmq-server erlang-sd_notify"
-    runCheck(msg, 'yum -y install rabbitmq-server erlang-sd_notify')
+    ensurePackages(componentPackages('messaging'))
     run('systemctl enable rabbitmq-server.service')
     run('systemctl start rabbitmq-server.service')
     run('systemctl restart rabbitmq-server.service')
@@ -12,6 +12,7 @@ sys.path.append('..')
 import env_config
 from myLib import runCheck, createDatabaseScript
 from myLib import keystone_check, database_check, align_y, align_n, saveConfigFile
+from myLib import ensurePackages, componentPackages
 
 ########################## Configuring Environment #################################
 
@@ -144,8 +145,7 @@ def createUsersRolesAndTenants(admin_token):
 
 @roles('controller')
 def installPackages():
-    msg = 'Install packages'
-    runCheck(msg, 'yum -y install openstack-keystone python-keystoneclient')
+    ensurePackages(componentPackages('keystone'))
 
     msg = "Start keystone service"
     runCheck(msg, "systemctl start openstack-keystone.service")
@@ -12,7 +12,8 @@ sys.path.append('..')
 import env_config
 import myLib
 from myLib import runCheck, createDatabaseScript, set_parameter
-from myLib import run_v, align_n, align_y, saveConfigFile
+from myLib import run_v, align_n, align_y, saveConfigFile, registerServices, tokenrc
+from myLib import cachedImage, ensurePackages, componentPackages
 
 import glusterLib
 
@@ -49,42 +50,7 @@ def setup_glance_keystone():
     (b) an endpoint for the 'glance' service
     """
 
-    GLANCE_PASS = passwd['GLANCE_PASS']
-    # get admin credentials to run the CLI commands
-    credentials = env_config.admin_openrc
-
-    with prefix(credentials):
-        # before each creation, we check a list to avoid duplicates
-        if 'glance' not in run("keystone user-list"):
-            msg = "Create user glance"
-            runCheck(msg, "keystone user-create --name glance --pass {}"\
-                    .format(GLANCE_PASS))
-
-            msg = "Give the user glance the role of admin"
-            runCheck(msg, "keystone user-role-add --user glance "
-                    "--tenant service --role admin")
-        else:
-            print blue("User glance already created. Do nothing")
-
-        if 'glance' not in run("keystone service-list"):
-            msg = "Create service glance"
-            runCheck(msg, "keystone service-create --name glance --type image "
-                    "--description 'OpenStack Image Service'")
-        else:
-            print blue("Service glance already created. Do nothing")
-
-        if 'http://controller:9292' not in run("keystone endpoint-list"):
-            msg = "Create endpoint for service glance"
-            runCheck(msg, "keystone endpoint-create "
-                    "--service-id $(keystone service-list "
-                    "| awk '/ image / {print $2}') "
-                    "--publicurl http://controller:9292 "
-                    "--internalurl http://controller:9292 "
-                    "--adminurl http://controller:9292 "
-                    "--region regionOne")
-        else:
-            print blue("Enpoint for service glance already created. "
-                    "Nothing done")
+    registerServices(['glance'])
 
 @roles('controller')
 def setup_glance_config_files():
@@ -199,8 +165,7 @@ def setup_glance_api_conf_file_for_gluster():
 @roles('controller')
 def install_packages():
     # Install packages
-    msg = "Install OpenStack Glance packages"
-    runCheck(msg, "yum install -y openstack-glance python-glanceclient")
+    ensurePackages(componentPackages('glance'))
    
 ################################ NFS ##########################################
 
@@ -240,12 +205,10 @@ def imageCreationTDD():
 
     result = 'OK'
     
-    msg = 'Retrieve instance image from the cirros website'
-    run_v("mkdir /tmp/images")
     url = "http://download.cirros-cloud.net/0.3.3/cirros-0.3.3-x86_64-disk.img"
-    runCheck(msg, "wget -qP /tmp/images " + url)
+    cachedImage(url)
 
-    with prefix(env_config.admin_openrc):
+    with prefix(tokenrc(env_config.admin_openrc)):
 
         msg = 'Create glance image'
         runCheck(msg, "glance image-create --name 'cirros-test' "
@@ -278,8 +241,7 @@ def imageCreationTDD():
     #    if r == 'FAIL':
     #        result = 'FAIL'
 
-    msg = 'Clear local files'
-    runCheck(msg, "rm -r /tmp/images")
+    # the image stays in the image cache for the next run
 
     return result
 
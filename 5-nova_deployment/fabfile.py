@@ -12,8 +12,11 @@ import sys
 sys.path.append('..')
 import env_config
 from myLib import runCheck, createDatabaseScript, set_parameter
-from myLib import database_check, keystone_check
-from myLib import align_n, align_y, run_v, saveConfigFile
+from myLib import database_check, keystone_check, requires, executeGraph
+from myLib import checkpoint, registerServices, tokenrc
+from myLib import serviceCatalog, registerScript
+from myLib import ensurePackages, componentPackages
+from myLib import align_n, align_y, run_v, saveConfigFile, ConfigBatch
 
 
 ############################ Config ########################################
@@ -27,14 +30,12 @@ novaGlusterDir = "/mnt/gluster/instance"
 ######################## Deployment ########################################
 
 @roles('controller')
+@checkpoint(lambda: componentPackages('nova'))
 def install_packages_controller():
-    msg = 'Install Nova packages on controller node(s)'
-    installation_command = "yum install -y openstack-nova-api openstack-nova-cert " + \
-                           "openstack-nova-conductor openstack-nova-console openstack-nova-novncproxy " + \
-                           "openstack-nova-scheduler python-novaclient"
-    runCheck(msg, installation_command)
+    ensurePackages(componentPackages('nova'), 'Install Nova packages on controller node(s)')
 
 @roles('controller')
+@checkpoint(passwd['NOVA_DBPASS'], uses=[createDatabaseScript])
 def setup_nova_database_on_controller():
 
     NOVA_DBPASS = passwd['NOVA_DBPASS']
@@ -45,6 +46,8 @@ def setup_nova_database_on_controller():
     runCheck(msg, 'echo "' + mysql_commands + '" | mysql -u root -p' + env_config.passwd['ROOT_SECRET'])
     
 @roles('controller')
+@checkpoint(passwd['NOVA_PASS'], serviceCatalog['nova'], registerScript,
+        uses=[registerServices])
 def setup_nova_keystone_on_controller():
     """
     Set up Keystone credentials for Nova
@@ -53,40 +56,12 @@ def setup_nova_keystone_on_controller():
     (b) an endpoint for the 'nova' service
     """
 
-    NOVA_PASS = passwd['NOVA_PASS']
+    registerServices(['nova'])
 
-    # get admin credentials to run the CLI commands
-    with prefix(env_config.admin_openrc):
-        # before each creation, we check a list to avoid duplicates
-
-        if 'nova' not in run("keystone user-list"):
-            msg = "Create user nova"
-            runCheck(msg, "keystone user-create --name nova --pass {}".format(NOVA_PASS))
-
-            msg = "Give the user nova the role of admin"
-            runCheck(msg, "keystone user-role-add --user nova --tenant service --role admin")
-        else:
-            print blue("User nova already created. Do nothing")
-
-        if 'nova' not in run("keystone service-list"):
-            msg = "Create service nova"
-            runCheck(msg, "keystone service-create --name nova --type compute " + \
-                    "--description 'OpenStack Compute'")
-        else:
-            print blue("Service nova already created. Do nothing")
-
-        if 'http://controller:8774' not in run("keystone endpoint-list"):
-            msg = "Create endpoint for service nova"
-            runCheck(msg, "keystone endpoint-create " + \
-                    "--service-id $(keystone service-list | awk '/ compute / {print $2}') " + \
-                    "--publicurl http://controller:8774/v2/%\(tenant_id\)s  " + \
-                    "--internalurl http://controller:8774/v2/%\(tenant_id\)s " + \
-                    "--adminurl http://controller:8774/v2/%\(tenant_id\)s " + \
-                    "--region regionOne")
-        else:
-            print blue("Enpoint for service nova already created. Do nothing")
-    
+@requires(install_packages_controller)
 @roles('controller')
+@checkpoint(passwd['NOVA_PASS'], passwd['NOVA_DBPASS'], passwd['RABBIT_PASS'],
+        env_config.nicDictionary['controller'])
 def setup_nova_config_files_on_controller():
 
     NOVA_PASS = passwd['NOVA_PASS']
@@ -94,43 +69,50 @@ def setup_nova_config_files_on_controller():
     RABBIT_PASS = passwd['RABBIT_PASS']
     CONTROLLER_MANAGEMENT_IP = env_config.nicDictionary['controller']['mgtIPADDR']
 
-    set_parameter(etc_nova_config_file, 'database', 'connection', 'mysql://nova:{}@controller/nova'.format(NOVA_DBPASS))
+    # queue all the edits and send them in one go
+    batch = ConfigBatch()
+
+    batch.set_parameter(etc_nova_config_file, 'database', 'connection', 'mysql://nova:{}@controller/nova'.format(NOVA_DBPASS))
 
-    set_parameter(etc_nova_config_file, 'DEFAULT', 'rpc_backend', 'rabbit')
-    set_parameter(etc_nova_config_file, 'DEFAULT', 'rabbit_host', 'controller')
-    set_parameter(etc_nova_config_file, 'DEFAULT', 'rabbit_password', RABBIT_PASS)
+    batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'rpc_backend', 'rabbit')
+    batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'rabbit_host', 'controller')
+    batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'rabbit_password', RABBIT_PASS)
 
-    set_parameter(etc_nova_config_file, 'DEFAULT', 'auth_strategy', 'keystone')
+    batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'auth_strategy', 'keystone')
 
-    set_parameter(etc_nova_config_file, 'keystone_authtoken', 'auth_uri', 'http://controller:5000/v2.0')
-    set_parameter(etc_nova_config_file, 'keystone_authtoken', 'identity_uri', 'http://controller:35357') 
-    set_parameter(etc_nova_config_file, 'keystone_authtoken', 'admin_tenant_name', 'service') 
-    set_parameter(etc_nova_config_file, 'keystone_authtoken', 'admin_user', 'nova')   
-    set_parameter(etc_nova_config_file, 'keystone_authtoken', 'admin_password', NOVA_PASS)   
+    batch.set_parameter(etc_nova_config_file, 'keystone_authtoken', 'auth_uri', 'http://controller:5000/v2.0')
+    batch.set_parameter(etc_nova_config_file, 'keystone_authtoken', 'identity_uri', 'http://controller:35357') 
+    batch.set_parameter(etc_nova_config_file, 'keystone_authtoken', 'admin_tenant_name', 'service') 
+    batch.set_parameter(etc_nova_config_file, 'keystone_authtoken', 'admin_user', 'nova')   
+    batch.set_parameter(etc_nova_config_file, 'keystone_authtoken', 'admin_password', NOVA_PASS)   
 
-    set_parameter(etc_nova_config_file, 'DEFAULT', 'my_ip', CONTROLLER_MANAGEMENT_IP)
+    batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'my_ip', CONTROLLER_MANAGEMENT_IP)
 
-    set_parameter(etc_nova_config_file, 'glance', 'host', 'controller')
-    set_parameter(etc_nova_config_file, 'DEFAULT', 'verbose', 'True')
+    batch.set_parameter(etc_nova_config_file, 'glance', 'host', 'controller')
+    batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'verbose', 'True')
 
-    set_parameter(etc_nova_config_file, 'libvirt', 'cpu_mode', 'host-passthrough')    
+    batch.set_parameter(etc_nova_config_file, 'libvirt', 'cpu_mode', 'host-passthrough')    
 
     if 'ipmi5' in check_output('echo $HOSTNAME',shell=True):
         # set this parameter if we are not in production mode
-        set_parameter(etc_nova_config_file, 'DEFAULT', 'novncproxy_host', '0.0.0.0')    
-        set_parameter(etc_nova_config_file, 'DEFAULT', 'novncproxy_port', '6080')    
-        set_parameter(etc_nova_config_file, 'DEFAULT', 'novncproxy_base_url', 'http://129.128.208.164:6080/vnc_auto.html')    
+        batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'novncproxy_host', '0.0.0.0')    
+        batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'novncproxy_port', '6080')    
+        batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'novncproxy_base_url', 'http://129.128.208.164:6080/vnc_auto.html')    
     else:
-        set_parameter(etc_nova_config_file, 'DEFAULT', 'vncserver_listen', CONTROLLER_MANAGEMENT_IP)
-        set_parameter(etc_nova_config_file, 'DEFAULT', 'vncserver_proxyclient_address', CONTROLLER_MANAGEMENT_IP)
-        
+        batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'vncserver_listen', CONTROLLER_MANAGEMENT_IP)
+        batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'vncserver_proxyclient_address', CONTROLLER_MANAGEMENT_IP)
+
+    batch.apply()
 
         
+@requires(setup_nova_database_on_controller, setup_nova_config_files_on_controller)
 @roles('controller')
+@checkpoint(passwd['NOVA_DBPASS'])
 def populate_database_on_controller():
     msg = "Populate database on controller node"
     runCheck(msg, "su -s /bin/sh -c 'nova-manage db sync' nova")
 
+@requires(populate_database_on_controller, setup_nova_keystone_on_controller)
 @roles('controller')
 def start_nova_services_on_controller():
     nova_services = "openstack-nova-api.service openstack-nova-cert.service " + \
@@ -146,13 +128,12 @@ def start_nova_services_on_controller():
     msg = "Restart nova services on controller"
     runCheck(msg, "systemctl restart " + nova_services)
 
-@parallel
+@parallel(pool_size=env_config.parallelPoolSize)
 @roles('compute')
+@checkpoint(lambda: componentPackages('nova'))
 def install_packages_compute():
 
-    msg = 'Install Nova packages'
-    installation_command = 'yum install -y openstack-nova-compute sysfsutils'
-    runCheck(msg, installation_command)
+    ensurePackages(componentPackages('nova'), 'Install Nova packages')
     
 def hardware_accel_check():
     """
@@ -167,8 +148,11 @@ def hardware_accel_check():
         set_parameter(etc_nova_config_file, 'libvirt', 'virt_type', 'qemu')
 
 
-@parallel
+@requires(install_packages_compute)
+@parallel(pool_size=env_config.parallelPoolSize)
 @roles('compute')
+@checkpoint(passwd['NOVA_PASS'], passwd['RABBIT_PASS'],
+        lambda: env_config.nicDictionary[env.host])
 def setup_nova_config_files_on_compute():
     """
     Set up variables on several config files on the compute node
@@ -178,46 +162,51 @@ def setup_nova_config_files_on_compute():
     NOVA_DBPASS = passwd['NOVA_DBPASS']
     RABBIT_PASS = passwd['RABBIT_PASS']
     MANAGEMENT_IP = env_config.nicDictionary[env.host]['mgtIPADDR']
-    
-    set_parameter(etc_nova_config_file, 'DEFAULT', 'rpc_backend', 'rabbit')
-    set_parameter(etc_nova_config_file, 'DEFAULT', 'rabbit_host', 'controller')
-    set_parameter(etc_nova_config_file, 'DEFAULT', 'rabbit_password', RABBIT_PASS)
 
-    set_parameter(etc_nova_config_file, 'DEFAULT', 'auth_strategy', 'keystone')
+    # queue all the edits and send them in one go
+    batch = ConfigBatch()
 
-    set_parameter(etc_nova_config_file, 'keystone_authtoken', 'auth_uri', 'http://controller:5000/v2.0')
-    set_parameter(etc_nova_config_file, 'keystone_authtoken', 'identity_uri', 'http://controller:35357') 
-    set_parameter(etc_nova_config_file, 'keystone_authtoken', 'admin_tenant_name', 'service') 
-    set_parameter(etc_nova_config_file, 'keystone_authtoken', 'admin_user', 'nova')   
-    set_parameter(etc_nova_config_file, 'keystone_authtoken', 'admin_password', NOVA_PASS)   
+    batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'rpc_backend', 'rabbit')
+    batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'rabbit_host', 'controller')
+    batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'rabbit_password', RABBIT_PASS)
 
-    set_parameter(etc_nova_config_file, 'DEFAULT', 'my_ip', MANAGEMENT_IP)
+    batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'auth_strategy', 'keystone')
 
-    set_parameter(etc_nova_config_file, 'DEFAULT', 'vnc_enabled', 'True')
-    set_parameter(etc_nova_config_file, 'DEFAULT', 'vncserver_listen', '0.0.0.0')
-    set_parameter(etc_nova_config_file, 'DEFAULT', 'vncserver_proxyclient_address', MANAGEMENT_IP)
-    set_parameter(etc_nova_config_file, 'DEFAULT', 'novncproxy_base_url', 'http://controller:6080/vnc_auto.html')
+    batch.set_parameter(etc_nova_config_file, 'keystone_authtoken', 'auth_uri', 'http://controller:5000/v2.0')
+    batch.set_parameter(etc_nova_config_file, 'keystone_authtoken', 'identity_uri', 'http://controller:35357') 
+    batch.set_parameter(etc_nova_config_file, 'keystone_authtoken', 'admin_tenant_name', 'service') 
+    batch.set_parameter(etc_nova_config_file, 'keystone_authtoken', 'admin_user', 'nova')   
+    batch.set_parameter(etc_nova_config_file, 'keystone_authtoken', 'admin_password', NOVA_PASS)   
 
+    batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'my_ip', MANAGEMENT_IP)
 
-    set_parameter(etc_nova_config_file, 'glance', 'host', 'controller')
-    set_parameter(etc_nova_config_file, 'DEFAULT', 'verbose', 'True')
+    batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'vnc_enabled', 'True')
+    batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'vncserver_listen', '0.0.0.0')
+    batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'vncserver_proxyclient_address', MANAGEMENT_IP)
+    batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'novncproxy_base_url', 'http://controller:6080/vnc_auto.html')
 
-    set_parameter(etc_nova_config_file, 'libvirt', 'cpu_mode', 'host-passthrough')    
+
+    batch.set_parameter(etc_nova_config_file, 'glance', 'host', 'controller')
+    batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'verbose', 'True')
+
+    batch.set_parameter(etc_nova_config_file, 'libvirt', 'cpu_mode', 'host-passthrough')    
 
     if 'ipmi5' in check_output('echo $HOSTNAME',shell=True):
         # set this parameter if we are not in production mode
-        set_parameter(etc_nova_config_file, 'DEFAULT', 'novncproxy_host', '0.0.0.0')    
-        set_parameter(etc_nova_config_file, 'DEFAULT', 'novncproxy_port', '6080')    
-        set_parameter(etc_nova_config_file, 'DEFAULT', 'novncproxy_base_url', 'http://129.128.208.164:6080/vnc_auto.html')    
+        batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'novncproxy_host', '0.0.0.0')    
+        batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'novncproxy_port', '6080')    
+        batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'novncproxy_base_url', 'http://129.128.208.164:6080/vnc_auto.html')    
     else:
-        set_parameter(etc_nova_config_file, 'DEFAULT', 'vncserver_listen', MANAGEMENT_IP)
-        set_parameter(etc_nova_config_file, 'DEFAULT', 'vncserver_proxyclient_address', MANAGEMENT_IP)
-        
+        batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'vncserver_listen', MANAGEMENT_IP)
+        batch.set_parameter(etc_nova_config_file, 'DEFAULT', 'vncserver_proxyclient_address', MANAGEMENT_IP)
+
+    batch.apply()
 
     hardware_accel_check()
 
 
-@parallel
+@requires(setup_nova_config_files_on_compute, start_nova_services_on_controller)
+@parallel(pool_size=env_config.parallelPoolSize)
 @roles('compute')
 def start_services_on_compute():
     msg = "Enable libvirt daemon"
@@ -265,18 +254,22 @@ def fixme():
 
 def deploy():
 
-    #nova installation on the controller
-    execute(install_packages_controller)
-    execute(setup_nova_database_on_controller)
-    execute(setup_nova_keystone_on_controller)
-    execute(setup_nova_config_files_on_controller)
-    execute(populate_database_on_controller)
-    execute(start_nova_services_on_controller)
-
-    #nova installation on the compute
-    execute(install_packages_compute)
-    execute(setup_nova_config_files_on_compute)        
-    execute(start_services_on_compute)
+    # each task starts as soon as the tasks it requires are done,
+    # so the compute nodes don't wait for the controller
+    executeGraph([
+        #nova installation on the controller
+        install_packages_controller,
+        setup_nova_database_on_controller,
+        setup_nova_keystone_on_controller,
+        setup_nova_config_files_on_controller,
+        populate_database_on_controller,
+        start_nova_services_on_controller,
+
+        #nova installation on the compute
+        install_packages_compute,
+        setup_nova_config_files_on_compute,
+        start_services_on_compute,
+        ])
 
     #execute(setup_nova_conf_file)
     #execute(setup_GlusterFS_Nova)
@@ -287,7 +280,7 @@ def deploy():
 def servicesTDD():
     "Check service-list to see if the nova services are up and running"
 
-    with prefix(env_config.admin_openrc):
+    with prefix(tokenrc(env_config.admin_openrc)):
         msg = 'Get service list'
         serviceList = runCheck(msg, 'nova service-list >service-list')
 
@@ -328,7 +321,7 @@ def servicesTDD():
 def imageTDD():
     "Run image-list to verify connectivity with Keystone and Glance"
 
-    with prefix(env_config.admin_openrc):
+    with prefix(tokenrc(env_config.admin_openrc)):
         msg = 'Run nova image-list'
         out = runCheck(msg, 'nova image-list')
         if 'ACTIVE' not in out:
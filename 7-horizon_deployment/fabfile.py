@@ -11,6 +11,7 @@ import sys
 sys.path.append('..')
 import env_config
 from myLib import runCheck, align_y, align_n, saveConfigFile
+from myLib import ensurePackages, componentPackages
 
 
 ############################ Config ########################################
@@ -30,8 +31,7 @@ def setup_horizon_config_files():
     have a non-standard format that is not compatible, so the setup
     is done with sed
     """
-    msg = 'Install packages'
-    runCheck(msg, "yum install -y openstack-dashboard httpd mod_wsgi memcached python-memcached")
+    ensurePackages(componentPackages('horizon'))
 
 
     # uncomment below if you wish to delete config file and reinstall it 
@@ -81,8 +81,7 @@ def start_horizon_services():
 
 def download_packages():
     # make sure we have crudini
-    msg = 'Install Crudini'
-    runCheck(msg, 'yum install -y crudini')
+    ensurePackages(['crudini'])
    
 def setup_horizon():
     setup_horizon_config_files()
@@ -12,6 +12,7 @@ sys.path.append('..')
 import env_config
 from myLib import runCheck, set_parameter, printMessage
 from myLib import database_check, keystone_check, align_y, align_n
+from myLib import registerServices, tokenrc, ensurePackages, componentPackages
 
 import glusterLib
 
@@ -29,42 +30,12 @@ def setKeystoneController():
     Create user, roles and tenants for Swift
     """
 
-    with prefix(env_config.admin_openrc):
-
-        if 'swift' not in sudo("keystone user-list"):
-            msg = "Create user swift"
-            runCheck(msg, "keystone user-create --name swift --pass {}".format(passwd['SWIFT_PASS']))
-
-            msg = "Add the role of admin to user swift"
-            runCheck(msg, "keystone user-role-add --user swift --tenant service --role admin")
-        else:
-            print blue('swift is already a user. Do nothing')
-
-        if 'swift' not in sudo("keystone service-list"):
-            msg = "Create service swift"
-            runCheck(msg, 'keystone service-create --name swift --type object-store --description "OpenStack Object Storage"')
-        else:
-            print blue('swift is already a service. Do nothing')
-
-        if 'http://controller:8080/' not in sudo("keystone endpoint-list"):
-            msg = "Create endpoint for service swift"
-            command = "keystone endpoint-create " +\
-                    "--service-id $(keystone service-list | awk '/ object-store / {print $2}') " +\
-                    "--publicurl 'http://controller:8080/v1/AUTH_%(tenant_id)s' " +\
-                    "--internalurl 'http://controller:8080/v1/AUTH_%(tenant_id)s' " +\
-                    "--adminurl http://controller:8080/ " +\
-                    "--region regionOne"
-            print 'command : ',command
-            runCheck(msg, command)
-        else:
-            print blue('8080 is already an endpoint. Do nothing')
+    registerServices(['swift'])
 
 @roles('controller')
 def installPackagesController():
-    msg = "Install Packages on controller"
     # package python-keystone-auth-token was changed to python-keystoneclient
-    runCheck(msg, "yum -y install openstack-swift-proxy python-swiftclient "
-            "python-keystonemiddleware memcached")
+    ensurePackages(componentPackages('swift'))
 
 
 @roles('controller')
@@ -438,8 +409,7 @@ def finalizeInstallation():
 @roles('compute')
 #@roles('storage')
 def installPackagesStorage():
-    msg = 'Install packages on host ' + env.host
-    runCheck(msg, "yum -y install openstack-swift-account openstack-swift-container openstack-swift-object")
+    ensurePackages(componentPackages('swift'))
 
 
 @roles('compute')
@@ -474,7 +444,7 @@ def testFile():
     testfile = 'FILE'
 
     # get creadentials for demo user
-    with prefix(env_config.demo_openrc):
+    with prefix(tokenrc(env_config.demo_openrc)):
 
         msg = "Create local test file"
         out = runCheck(msg, "echo 'Test file for Swift TDD\nline1\nline2\nline3' >" + testfile)
@@ -545,7 +515,7 @@ def curlTDD():
     TDD: make some curl operations and check their results
     """
 
-    with prefix(env_config.admin_openrc):
+    with prefix(tokenrc(env_config.admin_openrc)):
         msg = 'Get storage URL and token'
         url, token = runCheck(msg, "swift stat -v | awk '/StorageURL/ {print $2} /Auth Token/ {print $3}'").splitlines()
 
@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+"""
+Hashes of the settings in config files
+
+Run on the hosts by myLib.configDrift, which sends this file on the
+standard input of python, and imported locally to hash the snapshots
+the same way.
+
+Usage:
+    python configHash.py FILE...
+
+    Prints a JSON object mapping each file to the sha1 of its settings,
+    or null if it can't be read.
+
+Two files get the same hash when they have the same sections, keys and
+values, whatever their comments, blank lines, spacing and order.
+"""
+
+import sys
+import hashlib
+import json
+import re
+
+
+def settings(text):
+    """
+    Sorted list of the (section, key, value) tuples of an INI file
+
+    Lines that aren't settings (e.g. in files that aren't INI files)
+    are kept as keys without a value
+    """
+    section = ''
+    result = set()
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line[0] in '#;':
+            continue
+        match = re.match(r'^\[(.*)\]$', line)
+        if match:
+            section = match.group(1).strip()
+            continue
+        match = re.match(r'^([^=:]+?)\s*[=:]\s*(.*)$', line)
+        if match:
+            result.add((section, match.group(1), match.group(2)))
+        else:
+            result.add((section, line, None))
+    return sorted(result)
+
+def digest(text):
+    return hashlib.sha1(json.dumps(settings(text))).hexdigest()
+
+def main():
+    hashes = {}
+    for path in sys.argv[1:]:
+        try:
+            with open(path) as f:
+                hashes[path] = digest(f.read())
+        except IOError:
+            hashes[path] = None
+    print json.dumps(hashes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+from __future__ import with_statement
+from fabric.api import *
+from fabric.colors import green, red, blue
+import sys
+sys.path.append('..')
+import env_config
+from myLib import snapshotConfigs, snapshotManifests, readSnapshot, configDrift
+from myLib import align_y, align_n
+
+############################ Config ########################################
+
+env.roledefs = env_config.roledefs
+
+############################# Snapshots ####################################
+
+@parallel(pool_size=env_config.parallelPoolSize)
+@roles(env_config.roles)
+def snapshot(status=None):
+    """
+    Save the config files of every host in ../local_copies_config_files
+
+    Each host archives its files and sends them in one transfer; only
+    contents that changed since the previous snapshots are stored.
+    Usage: fab snapshot or fab snapshot:good
+    """
+    snapshotConfigs(status)
+
+@roles(env_config.roles)
+def list_snapshots():
+    "Show the snapshots saved for each host"
+    manifests = snapshotManifests()
+    if not manifests:
+        print blue('No snapshot of ' + env.host)
+    for manifest in manifests:
+        print blue('{}: {} files'.format(manifest, len(readSnapshot(manifest))))
+
+@parallel(pool_size=env_config.parallelPoolSize)
+@roles(env_config.roles)
+def drift(status='good'):
+    """
+    Check that the config files of every host still match their last
+    good snapshot (or the last one with the given status)
+
+    Costs one round trip per host when nothing changed; the files that
+    changed are saved as a 'drift' snapshot and their changes printed
+    """
+    return configDrift(status)
+
+def deploy():
+    execute(snapshot)
+
+def tdd():
+    results = execute(drift)
+
+    drifted = sorted(host for host, files in results.items() if files)
+    unknown = sorted(host for host, files in results.items() if files is None)
+    if unknown:
+        print align_n('No snapshot to compare with for ' + ', '.join(unknown))
+    if drifted:
+        for host in drifted:
+            print align_n('{}: {}'.format(host, ', '.join(results[host])))
+        sys.exit(1)
+    print align_y('No config drift')
@@ -260,7 +260,7 @@ def restoreDB():
     Delete the database and repopulate it
     """
 
-    database_script = createDatabaseScript('neutron',passwd['NEUTRON_DBPASS'])
+    database_script = createDatabaseScript('neutron',passwd['NEUTRON_DBPASS'],drop=True)
     msg = "Recreate MySQL database for neutron"
     runCheck(msg, '''echo "{}" | mysql -u root -p{}'''.format(
         database_script, env_config.passwd['ROOT_SECRET']))
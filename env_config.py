@@ -7,6 +7,9 @@ from fabric.api import *
 
 ######################### Global variables ####################################
 
+# maximum number of hosts a @parallel task works on at the same time
+parallelPoolSize = 4
+
 lslogs = ['/var/log/nova/nova-manage.log',
           '/var/log/nova/nova-api.log',
           '/var/log/heat/heat-manage.log',
@@ -40,6 +43,80 @@ lslogs = ['/var/log/nova/nova-manage.log',
           '/var/log/messages',
           ]
 
+# Logs read by checkLog when a command fails, by the service being
+# deployed (taken from the name of the deployment directory, e.g.
+# 'nova' for 5-nova_deployment). commonLogs are always read.
+# Services that are not listed here get every log in lslogs
+serviceLogs = {
+        'messaging' : ['/var/log/rabbitmq/*.log'],
+        'keystone' : ['/var/log/keystone/*.log'],
+        'glance' : ['/var/log/glance/*.log'],
+        'nova' : ['/var/log/nova/*.log'],
+        'neutron' : ['/var/log/neutron/*.log', '/var/log/openvswitch/*.log'],
+        'horizon' : ['/var/log/httpd/error_log'],
+        'cinder' : ['/var/log/cinder/*.log'],
+        'swift' : ['/var/log/swift/*.log'],
+        'heat' : ['/var/log/heat/*.log'],
+        'ceilometer' : ['/var/log/ceilometer/*.log'],
+        'trove' : ['/var/log/trove/*.log'],
+        'sahara' : ['/var/log/sahara/*.log'],
+        'instance' : ['/var/log/nova/*.log', '/var/log/cinder/*.log',
+                      '/var/log/glance/*.log', '/var/log/neutron/*.log'],
+        }
+
+commonLogs = ['/var/log/messages',
+              '/var/log/mariadb/*.log',
+              '/var/log/rabbitmq/*.log',
+              ]
+
+# Packages installed by the deployment, by component and role ('all'
+# for every node). The package mirror (0.1-package_mirror) downloads
+# all of them, and their dependencies, once to the controller
+packages = {
+        'base' : {'all' : ['yum-plugin-priorities', 'epel-release', 'chrony',
+                           'crudini', 'wget', 'openstack-utils', 'tcpdump',
+                           'nmon', 'iptraf', 'traceroute', 'vim-X11',
+                           'vim-common', 'vim-enhanced', 'vim-minimal']},
+        'mariadb' : {'controller' : ['mariadb', 'mariadb-server', 'MySQL-python']},
+        'messaging' : {'controller' : ['rabbitmq-server', 'erlang-sd_notify']},
+        'keystone' : {'controller' : ['openstack-keystone', 'python-keystoneclient']},
+        'glance' : {'controller' : ['openstack-glance', 'python-glanceclient']},
+        'nova' : {'controller' : ['openstack-nova-api', 'openstack-nova-cert',
+                                  'openstack-nova-conductor', 'openstack-nova-console',
+                                  'openstack-nova-novncproxy', 'openstack-nova-scheduler',
+                                  'python-novaclient'],
+                  'compute' : ['openstack-nova-compute', 'sysfsutils']},
+        'neutron' : {'controller' : ['openstack-neutron', 'openstack-neutron-ml2',
+                                     'python-neutronclient', 'which'],
+                     'network' : ['openstack-neutron', 'openstack-neutron-ml2',
+                                  'openstack-neutron-openvswitch'],
+                     'compute' : ['openstack-neutron-ml2', 'openstack-neutron-openvswitch']},
+        'horizon' : {'controller' : ['openstack-dashboard', 'httpd', 'mod_wsgi',
+                                     'memcached', 'python-memcached']},
+        'cinder' : {'controller' : ['openstack-cinder', 'python-oslo-db', 'MySQL-python'],
+                    'storage' : ['openstack-cinder', 'targetcli', 'python-oslo-db',
+                                 'MySQL-python']},
+        'nfs' : {'controller' : ['nfs-utils'],
+                 'storage' : ['nfs-utils', 'rpcbind']},
+        'swift' : {'controller' : ['openstack-swift-proxy', 'python-swiftclient',
+                                   'python-keystonemiddleware', 'memcached'],
+                   'compute' : ['openstack-swift-account', 'openstack-swift-container',
+                                'openstack-swift-object']},
+        'heat' : {'controller' : ['openstack-heat-api', 'openstack-heat-api-cfn',
+                                  'openstack-heat-engine', 'python-heatclient']},
+        'ceilometer' : {'controller' : ['openstack-ceilometer-api',
+                                        'openstack-ceilometer-collector',
+                                        'openstack-ceilometer-notification',
+                                        'openstack-ceilometer-central',
+                                        'openstack-ceilometer-alarm',
+                                        'python-ceilometerclient'],
+                        'compute' : ['openstack-ceilometer-compute',
+                                     'python-ceilometerclient', 'python-pecan']},
+        'mongodb' : {'controller' : ['mongodb-server', 'mongodb']},
+        'trove' : {'controller' : ['openstack-trove', 'python-troveclient']},
+        'sahara' : {'controller' : ['openstack-sahara', 'python-saharaclient']},
+        }
+
 ###############################################################################
 #  ascii art generated from http://www.network-science.de/ascii/  Font = ogre 
 '''
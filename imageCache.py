@@ -0,0 +1,353 @@
+#! /usr/bin/env python
+"""
+Image cache for the OpenStack hosts
+
+Copied to a host and run there by myLib.cachedImage. Images are stored
+once, by sha256, and linked to where they are needed, so the TDDs and
+instance launches only download an image the first time.
+
+Usage:
+    python imageCache.py [options] URL DEST
+
+    Makes DEST (e.g. /tmp/images/cirros-0.3.3-x86_64-disk.img) a link to
+    the cached copy of URL, downloading it first if needed.
+
+Downloads are split in ranges fetched in parallel when the server
+supports it, and resume from what a previous interrupted run left, as
+long as the file didn't change on the server. Each download is checked
+against its size and, if given, its sha256. When the cache grows over
+its maximum size, the least recently used images are removed, except
+those linked in the last few hours, which may still be in use.
+"""
+
+import os, sys
+import errno
+import fcntl
+import hashlib
+import json
+import optparse
+import shutil
+import threading
+import time
+import urllib2
+
+# files smaller than this are downloaded in one piece
+minRangeSize = 64 * 1024 * 1024
+
+chunkSize = 1024 * 1024
+
+# an image linked less than this long ago is never evicted, since
+# whoever linked it may not have uploaded it yet
+pinSeconds = 12 * 3600
+
+
+class Cache(object):
+
+    def __init__(self, directory, maxSize):
+        self.directory = directory
+        self.maxSize = maxSize
+        self.objects = os.path.join(directory, 'objects')
+        self.partial = os.path.join(directory, 'partial')
+        self.pins = os.path.join(directory, 'pins')
+        self.indexFile = os.path.join(directory, 'index.json')
+        for d in [self.objects, self.partial, self.pins]:
+            if not os.path.isdir(d):
+                os.makedirs(d)
+
+    def lock(self, name='index'):
+        "Exclusive lock, held until the returned file is closed"
+        lockFile = open(os.path.join(self.directory, '.' + name + '.lock'), 'w')
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        return lockFile
+
+    def readIndex(self):
+        try:
+            with open(self.indexFile) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {'urls': {}, 'used': {}}
+
+    def writeIndex(self, index):
+        tmp = self.indexFile + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.rename(tmp, self.indexFile)
+
+    def objectPath(self, sha256):
+        return os.path.join(self.objects, sha256)
+
+    def lookup(self, url, remote, sha256=None):
+        """
+        Hash of the cached copy of url, or None if there isn't a good one
+
+        remote holds the size and validators the server gives now (empty
+        if it can't be reached); a copy made from different ones is stale
+        """
+        index = self.readIndex()
+        if sha256:
+            if os.path.isfile(self.objectPath(sha256)):
+                return sha256
+            return None
+
+        entry = index['urls'].get(url)
+        if not entry or not os.path.isfile(self.objectPath(entry['sha256'])):
+            return None
+        if os.path.getsize(self.objectPath(entry['sha256'])) != entry['size']:
+            return None
+        for key in ['size', 'etag', 'modified']:
+            if remote.get(key) and entry.get(key) and remote[key] != entry[key]:
+                return None
+        return entry['sha256']
+
+    def store(self, url, remote, path):
+        "Move a downloaded file into the cache; return its hash"
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunkSize), ''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+
+        with self.lock():
+            os.rename(path, self.objectPath(digest))
+            index = self.readIndex()
+            index['urls'][url] = {
+                    'sha256': digest,
+                    'size': os.path.getsize(self.objectPath(digest)),
+                    'etag': remote.get('etag'),
+                    'modified': remote.get('modified'),
+                    }
+            index['used'][digest] = time.time()
+            self.writeIndex(index)
+        return digest
+
+    def touch(self, digest):
+        with self.lock():
+            index = self.readIndex()
+            index['used'][digest] = time.time()
+            self.writeIndex(index)
+
+    def pin(self, digest, dest):
+        "Keep an object from being evicted for pinSeconds, for dest"
+        pinFile = os.path.join(self.pins, '{}.{}'.format(
+            digest, hashlib.sha1(dest).hexdigest()))
+        with open(pinFile, 'w') as f:
+            f.write(dest + '\n')
+
+    def pinned(self):
+        "Hashes of the pinned objects. Removes the expired pins"
+        digests = set()
+        for pinFile in os.listdir(self.pins):
+            path = os.path.join(self.pins, pinFile)
+            try:
+                if os.path.getmtime(path) > time.time() - pinSeconds:
+                    digests.add(pinFile.split('.')[0])
+                else:
+                    os.remove(path)
+            except OSError:
+                # removed by another process in the meantime
+                pass
+        return digests
+
+    def evict(self, keep):
+        "Remove the least recently used objects until the cache fits"
+        with self.lock():
+            index = self.readIndex()
+            keep = self.pinned() | set([keep])
+            objects = [o for o in os.listdir(self.objects) if o not in keep]
+            total = sum(os.path.getsize(self.objectPath(o)) for o in os.listdir(self.objects))
+            for digest in sorted(objects, key=lambda o: index['used'].get(o, 0)):
+                if total <= self.maxSize:
+                    break
+                total -= os.path.getsize(self.objectPath(digest))
+                self.remove(index, digest)
+                print 'Evicted', digest
+            self.writeIndex(index)
+
+    def remove(self, index, digest):
+        "Remove an object and the index entries pointing to it"
+        os.remove(self.objectPath(digest))
+        index['used'].pop(digest, None)
+        for url in [u for u, e in index['urls'].items() if e['sha256'] == digest]:
+            del index['urls'][url]
+
+    def discard(self, digest):
+        with self.lock():
+            index = self.readIndex()
+            self.remove(index, digest)
+            self.writeIndex(index)
+
+
+def headers(url):
+    "Size, validators and range support of url; empty if it can't be reached"
+    request = urllib2.Request(url)
+    request.get_method = lambda: 'HEAD'
+    try:
+        info = urllib2.urlopen(request, timeout=30).info()
+    except (urllib2.URLError, IOError):
+        return {}
+    size = info.getheader('Content-Length')
+    return {
+            'size': int(size) if size else None,
+            'etag': info.getheader('ETag'),
+            'modified': info.getheader('Last-Modified'),
+            'ranges': info.getheader('Accept-Ranges') == 'bytes',
+            }
+
+
+def validator(remote):
+    "Value for If-Range: a strong ETag, else the Last-Modified date"
+    etag = remote.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return remote.get('modified')
+
+def fetchRange(url, path, start, end, whole, ifRange, errors):
+    """
+    Download bytes start to end (inclusive; end None for the rest of the
+    file) of url, appending to path. Bytes already in path are skipped.
+    whole tells whether the range is the whole file, in which case a
+    full response (the server ignored the range, or the file changed
+    since ifRange) is written in place of what path had
+    """
+    try:
+        have = os.path.getsize(path) if os.path.exists(path) else 0
+        if end is not None and start + have > end:
+            return
+        request = urllib2.Request(url)
+        if start + have > 0 or end is not None:
+            request.add_header('Range', 'bytes={}-{}'.format(
+                start + have, '' if end is None else end))
+            if ifRange:
+                request.add_header('If-Range', ifRange)
+        response = urllib2.urlopen(request, timeout=60)
+        if response.getcode() == 206:
+            mode = 'ab'
+        elif whole:
+            # start over
+            have = 0
+            mode = 'wb'
+        else:
+            raise IOError('got the whole file instead of a range; '
+                    'it may have changed on the server')
+        with open(path, mode) as f:
+            for chunk in iter(lambda: response.read(chunkSize), ''):
+                f.write(chunk)
+    except Exception as e:
+        errors.append('{}: {}'.format(path, e))
+
+
+def resumable(cache, name, state):
+    """
+    Remove the partial files of an earlier download of the same url
+    unless it was made with the same size, validators and ranges
+    """
+    stateFile = os.path.join(cache.partial, name + '.json')
+    try:
+        with open(stateFile) as f:
+            previous = json.load(f)
+    except (IOError, ValueError):
+        previous = None
+    if previous != state:
+        for partial in os.listdir(cache.partial):
+            if partial.startswith(name + '.'):
+                os.remove(os.path.join(cache.partial, partial))
+        with open(stateFile, 'w') as f:
+            json.dump(state, f)
+
+def download(cache, url, remote, parts):
+    "Download url into the partial directory; return the path of the file"
+    name = hashlib.sha1(url).hexdigest()
+    size = remote.get('size')
+
+    if remote.get('ranges') and size and size >= minRangeSize and parts > 1:
+        step = size // parts + 1
+        ranges = [(i * step, min((i + 1) * step, size) - 1) for i in range(parts)]
+    else:
+        ranges = [(0, size - 1 if size else None)]
+
+    resumable(cache, name, {'size': size, 'etag': remote.get('etag'),
+        'modified': remote.get('modified'), 'ranges': [list(r) for r in ranges]})
+
+    paths = [os.path.join(cache.partial, '{}.{}'.format(name, i)) for i in range(len(ranges))]
+    errors = []
+    threads = [threading.Thread(target=fetchRange,
+                args=(url, path, start, end, len(ranges) == 1, validator(remote), errors))
+            for path, (start, end) in zip(paths, ranges)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        sys.exit('Download of {} failed (run again to resume):\n{}'.format(url, '\n'.join(errors)))
+
+    target = os.path.join(cache.partial, name)
+    with open(target, 'wb') as out:
+        for path in paths:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, out, chunkSize)
+    for path in paths:
+        os.remove(path)
+    os.remove(os.path.join(cache.partial, name + '.json'))
+
+    received = os.path.getsize(target)
+    if size and received != size:
+        os.remove(target)
+        sys.exit('Download of {} is {} bytes instead of {}'.format(url, received, size))
+    return target
+
+
+def link(source, dest):
+    if not os.path.isdir(os.path.dirname(dest)):
+        os.makedirs(os.path.dirname(dest))
+    try:
+        os.remove(dest)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+    os.symlink(source, dest)
+
+
+def main():
+    parser = optparse.OptionParser(usage=__doc__)
+    parser.add_option('--cache', default='/var/cache/openstack-images',
+            help='cache directory')
+    parser.add_option('--max-size', type='int', default=50 * 1024,
+            help='maximum size of the cache in MB')
+    parser.add_option('--sha256', default=None,
+            help='expected sha256 of the image')
+    parser.add_option('--parts', type='int', default=4,
+            help='number of ranges downloaded in parallel')
+    options, args = parser.parse_args()
+
+    if len(args) != 2:
+        parser.print_usage()
+        sys.exit(1)
+    url, dest = args
+
+    cache = Cache(options.cache, options.max_size * 1024 * 1024)
+    remote = headers(url)
+
+    # one download per url at a time; others wait and then find it cached
+    with cache.lock(hashlib.sha1(url).hexdigest()):
+        digest = cache.lookup(url, remote, options.sha256)
+        if digest:
+            print 'Cached', url, digest
+            cache.touch(digest)
+        else:
+            if not remote:
+                sys.exit("Can't reach {} and it isn't cached".format(url))
+            start = time.time()
+            digest = cache.store(url, remote, download(cache, url, remote, options.parts))
+            print 'Downloaded', url, digest, 'in %.1f s' % (time.time() - start)
+            if options.sha256 and digest != options.sha256:
+                cache.discard(digest)
+                sys.exit('{} has sha256 {} instead of {}'.format(url, digest, options.sha256))
+
+        link(cache.objectPath(digest), dest)
+        cache.pin(digest, dest)
+
+    cache.evict(keep=digest)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+JSON-lines log for the deployment
+
+An optional logging handler that writes one JSON object per record,
+with the host, stage and task it comes from and, for the records of
+runCheck, the command, its duration and its exit code. Messages (the
+output of the commands) are truncated, and records are written by a
+background thread so that logging a large output doesn't hold up the
+task.
+
+Turn it on with
+
+    fab --set json_log=deploy.jsonl deploy
+    ./runfab.py -J deploy.jsonl 0 8
+
+and query it with e.g.
+
+    jq 'select(.exit_code != 0)' deploy.jsonl
+"""
+
+from __future__ import with_statement
+import os
+import json
+import time
+import logging
+import threading
+import Queue
+import multiprocessing.util
+
+from fabric.api import env
+
+import timingLib
+
+# fields taken from the extra argument of the logging calls
+extraFields = ['command', 'seconds', 'exit_code']
+
+
+def decode(text):
+    "Unicode version of command output, which may not be valid UTF-8"
+    if isinstance(text, str):
+        return unicode(text, 'utf-8', 'replace')
+    return text
+
+def truncate(text, maxSize):
+    "Text cut to about maxSize characters, keeping its beginning and end"
+    if text is None or len(text) <= maxSize:
+        return text
+    head = maxSize // 4
+    tail = maxSize - head
+    return u'{}\n... [{} characters omitted] ...\n{}'.format(
+            text[:head], len(text) - head - tail, text[-tail:])
+
+
+class JsonLinesHandler(logging.Handler):
+    """
+    Logging handler writing JSON lines from a background thread
+
+    Records are queued, at most queueSize of them; when the writer
+    falls behind, new records are dropped and the number dropped is
+    written with the next one. Messages and commands longer than
+    maxOutput characters are truncated before being queued.
+
+    A forked process (stage run next to others, @parallel task) starts
+    its own writer the first time it logs, and waits for it to finish
+    writing when it exits.
+    """
+
+    def __init__(self, filename, maxOutput=8192, queueSize=1000):
+        logging.Handler.__init__(self)
+        self.filename = filename
+        self.maxOutput = maxOutput
+        self.queueSize = queueSize
+        self.pid = None
+        self.dropped = 0
+
+    def start(self):
+        self.pid = os.getpid()
+        self.queue = Queue.Queue(self.queueSize)
+        self.dropped = 0
+        self.writer = threading.Thread(target=self.write)
+        self.writer.daemon = True
+        self.writer.start()
+        # multiprocessing runs this when a forked process exits
+        multiprocessing.util.Finalize(self, self.stop, exitpriority=10)
+
+    def write(self):
+        with open(self.filename, 'a') as f:
+            while True:
+                line = self.queue.get()
+                if line is None:
+                    self.queue.task_done()
+                    return
+                f.write(line)
+                if self.queue.empty():
+                    f.flush()
+                self.queue.task_done()
+
+    def fields(self, record):
+        entry = {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)),
+                'level': record.levelname,
+                'message': truncate(decode(record.getMessage()), self.maxOutput),
+                'host': env.host_string,
+                'stage': os.path.basename(os.getcwd()),
+                'task': timingLib.currentTask(),
+                'pid': os.getpid(),
+                }
+        for field in extraFields:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if 'command' in entry:
+            entry['command'] = truncate(decode(entry['command']), self.maxOutput)
+        return entry
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            self.start()
+        try:
+            entry = self.fields(record)
+            if self.dropped:
+                entry['dropped'] = self.dropped
+            line = json.dumps(entry, sort_keys=True) + '\n'
+        except Exception:
+            self.handleError(record)
+            return
+        try:
+            self.queue.put_nowait(line)
+            self.dropped = 0
+        except Queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        "Wait until the queued records are written"
+        if self.pid == os.getpid():
+            self.queue.join()
+
+    def stop(self):
+        if self.pid == os.getpid() and self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+
+    def close(self):
+        self.stop()
+        logging.Handler.close(self)
+
+
+def enableJsonLog(filename, level=logging.INFO):
+    """
+    Add a JsonLinesHandler to the root logger, once per file
+
+    The other handlers keep logging at the level they had, so the text
+    log doesn't get more verbose
+    """
+    filename = os.path.abspath(filename)
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if isinstance(handler, JsonLinesHandler) and handler.filename == filename:
+            return handler
+        if handler.level == logging.NOTSET:
+            handler.setLevel(root.level)
+
+    handler = JsonLinesHandler(filename)
+    handler.setLevel(level)
+    root.addHandler(handler)
+    root.setLevel(min(root.level, level))
+    return handler
@@ -0,0 +1,285 @@
+#! /usr/bin/env python
+"""
+Python replacement for runfab.sh
+
+Runs fabric tasks on a range of deployment directories, in a single
+process. The fabfile of each directory is loaded as a module and its
+tasks are run with fabric's execute, so Python, env_config and myLib
+are loaded once and the SSH connection to each host is opened once for
+the whole range instead of once per directory.
+
+Usage:
+    ./runfab.py [-options] f [l]
+
+    where
+      f : first script, by number
+      l : last script, by number
+
+Example:
+    ./runfab.py 0 13
+    ./runfab.py -t tdd 6
+    ./runfab.py -j 3 0 13
+    ./runfab.py -p 0 8
+
+With -j N, stages whose dependencies (see stageDependencies) are done
+run at the same time, up to N at once. Stages that run alone stay in
+this process and keep sharing its connections; stages that run next to
+others are forked and open their own.
+
+The tasks of each fabfile are timed (see timingLib.py); the slowest
+tasks and commands of the run are printed at the end.
+
+With -p, every remote command run through runCheck or run_v is
+classified by executable, and the calls, total time and latency
+histogram per host of each one are printed at the end.
+"""
+
+from __future__ import with_statement
+import sys, os
+import re
+import imp
+import optparse
+import datetime
+
+from fabric.api import env, execute
+from fabric.main import parse_arguments
+from fabric.network import disconnect_all
+from fabric.colors import green, red
+
+rootDir = os.path.dirname(os.path.abspath(__file__))
+
+# the fabfiles import env_config and myLib from the parent directory
+sys.path.insert(0, rootDir)
+from myLib import runGraph, profileHooks, CommandProfiler
+import timingLib
+from logLib import enableJsonLog
+
+# Stages each stage needs, by number. Dependencies that are outside the
+# range being run are assumed to be done already. Stages that are not
+# listed here depend on every stage with a lower number
+stageDependencies = {
+        '0' : [],
+        '0.1' : ['0'],
+        '1' : ['0.1'],
+        '2' : ['1'],
+        '3' : ['2'],
+        '4' : ['3'],
+        '5' : ['4'],
+        '6' : ['5'],
+        '7' : ['6'],
+        '7.1' : ['7'],
+        '8' : ['6'],
+        '9' : ['3'],
+        '10' : ['5', '6'],
+        '11' : ['4', '5', '8'],
+        '12' : ['5', '6'],
+        '13' : ['5', '6'],
+        '14' : ['4', '5', '6', '8'],
+        '16' : ['3'],
+        }
+
+
+class Tee(object):
+    "Write to a stream and append a copy to a log file"
+
+    def __init__(self, stream, logfile):
+        self.stream = stream
+        self.logfile = logfile
+
+    def write(self, data):
+        self.stream.write(data)
+        self.logfile.write(data)
+
+    def flush(self):
+        self.stream.flush()
+        self.logfile.flush()
+
+    def isatty(self):
+        return self.stream.isatty()
+
+
+def stageNumber(directory):
+    "Numeric prefix of a deployment directory, e.g. 7.1 for 7.1-customize_dashboard"
+    return float(directory.split('-')[0])
+
+def stageKey(directory):
+    "Number of a deployment directory as a string, e.g. '7.1'"
+    return directory.split('-')[0]
+
+def dependencies(directory, directories):
+    "Directories among the selected ones that a stage has to wait for"
+    key = stageKey(directory)
+    if key in stageDependencies:
+        return [d for d in directories if stageKey(d) in stageDependencies[key]]
+    return [d for d in directories if stageNumber(d) < stageNumber(directory)]
+
+def stageDirectories(first, last=None):
+    """
+    Return the deployment directories to run, sorted by number
+
+    Same selection as runfab.sh: with only the first number, the
+    directory starting with it; otherwise every directory from the
+    first to the last, inclusive
+    """
+    directories = [d for d in os.listdir(rootDir)
+            if re.match(r'^[\d.]+-', d)
+            and '.bak' not in d
+            and os.path.isfile(os.path.join(rootDir, d, 'fabfile.py'))]
+    directories.sort(key=stageNumber)
+
+    if last is None:
+        return [d for d in directories if d.startswith(first + '-')]
+
+    selected = []
+    inRange = False
+    for d in directories:
+        if d.startswith(first + '-'):
+            inRange = True
+        if inRange:
+            selected.append(d)
+        if inRange and d.startswith(last + '-'):
+            break
+    return selected
+
+def loadStage(directory):
+    """
+    Import the fabfile of a deployment directory as a module
+
+    The fabfiles use paths relative to their own directory, so the
+    working directory is changed to it and left there for its tasks
+    """
+    os.chdir(os.path.join(rootDir, directory))
+    name = 'fabfile_' + re.sub(r'\W', '_', directory)
+    return imp.load_source(name, os.path.join(rootDir, directory, 'fabfile.py'))
+
+def runStage(directory, tasks):
+    "Run a list of fab-style task strings (e.g. 'deploy', 'tdd') on a stage"
+    print green("\n Now on %s \n" % directory)
+
+    module = loadStage(directory)
+    timingLib.timeTasks(module)
+
+    for name, args, kwargs, hosts, roles, exclude_hosts in parse_arguments(tasks):
+        task = getattr(module, name, None)
+        if not callable(task):
+            print red("No task called %s in %s" % (name, directory))
+            sys.exit(1)
+
+        execute(task, hosts=hosts, roles=roles,
+                exclude_hosts=exclude_hosts, *args, **kwargs)
+
+def criticalPath(directories, times):
+    """
+    Return the chain of stages that determined the total run time,
+    and its length in seconds
+
+    times maps each directory to its (start, end) times
+    """
+    longest = {}
+    previous = {}
+    for d in sorted(directories, key=stageNumber):
+        duration = times[d][1] - times[d][0]
+        deps = dependencies(d, directories)
+        before = max(deps, key=lambda dep: longest[dep]) if deps else None
+        longest[d] = duration + (longest[before] if before else 0)
+        previous[d] = before
+
+    last = max(directories, key=lambda d: longest[d])
+    path = []
+    d = last
+    while d:
+        path.insert(0, d)
+        d = previous[d]
+    return path, longest[last]
+
+def printTimes(directories, times):
+    "Print the time spent in each stage and the critical path"
+    print "\nTime per stage:"
+    for d in sorted(directories, key=stageNumber):
+        print "  %-30s %8.1f s" % (d, times[d][1] - times[d][0])
+
+    path, length = criticalPath(directories, times)
+    print "Critical path (%.1f s): %s\n" % (length, ' -> '.join(path))
+
+def main():
+    parser = optparse.OptionParser(usage=__doc__)
+    parser.add_option('-t', dest='task', default='deploy tdd',
+            help="fabric task(s) to run. Default is 'deploy tdd'")
+    parser.add_option('-R', dest='roles', default=None,
+            help="comma-separated list of roles to run the task on. "
+                 "This doesn't override the @roles decorator")
+    parser.add_option('-w', dest='warn_only', action='store_true', default=False,
+            help="warn only. Won't abort if there is an error in a task")
+    parser.add_option('-f', dest='logfile', default='deploy.log',
+            help="file to log results in; default is 'deploy.log'")
+    parser.add_option('-j', dest='jobs', type='int', default=1,
+            help="maximum number of stages to run at once. Default is 1")
+    parser.add_option('-p', dest='profile', action='store_true', default=False,
+            help="profile the remote commands and print the time spent "
+                 "per executable (yum, crudini, mysql...) at the end")
+    parser.add_option('-J', dest='json_log', default=None,
+            help="also log to this file, one JSON object per line "
+                 "(see logLib.py)")
+    parser.add_option('-a', dest='ignore_journal', action='store_true', default=False,
+            help="run all tasks again, even those the checkpoint journal "
+                 "marks as done")
+
+    options, args = parser.parse_args()
+
+    if len(args) not in (1, 2):
+        print "Invalid number of parameters"
+        parser.print_usage()
+        sys.exit(1)
+
+    first = args[0]
+    last = args[1] if len(args) == 2 else None
+    directories = stageDirectories(first, last)
+    tasks = options.task.split()
+
+    if options.roles:
+        env.roles = options.roles.split(',')
+    if options.warn_only:
+        env.warn_only = True
+    if options.ignore_journal:
+        env.ignore_journal = True
+    if options.json_log:
+        enableJsonLog(options.json_log)
+
+    profileFile = os.path.join(rootDir, 'profile.jsonl')
+    if options.profile:
+        profileHooks.append(CommandProfiler(profileFile))
+
+    logfile = open(os.path.join(rootDir, options.logfile), 'a')
+    sys.stdout = Tee(sys.stdout, logfile)
+
+    start = datetime.datetime.now()
+    print "\n############################## %s ##############################\n" % \
+            start.strftime('%a, %d %b %Y %H:%M:%S')
+
+    try:
+        times = runGraph(directories,
+                lambda d: dependencies(d, directories),
+                lambda d: runStage(d, tasks),
+                max(options.jobs, 1))
+        printTimes(directories, times)
+        timingLib.printSummary(timingLib.readRecords(timingLib.runId))
+        print "\nTiming records: %s\n" % timingLib.timingFile
+        if options.profile:
+            CommandProfiler.load(profileFile, timingLib.runId).report()
+    finally:
+        # one disconnection per host, for the whole range
+        disconnect_all()
+        sys.stdout = sys.stdout.stream
+        logfile.close()
+
+    end = datetime.datetime.now()
+
+    if last:
+        print green("\nSuccessfully ran %s from %s to %s\n" % (options.task, first, last))
+    else:
+        print green("\nSuccessfully ran %s on %s\n" % (options.task, first))
+    print green("Start time: %s\n" % start.strftime('%a, %d %b %Y %H:%M:%S'))
+    print green("End time: %s\n" % end.strftime('%a, %d %b %Y %H:%M:%S'))
+
+if __name__ == '__main__':
+    main()
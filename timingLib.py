@@ -0,0 +1,155 @@
+"""
+Timing records for the deployment
+
+Every task run by runfab.py and every runCheck and set_parameter call
+appends one line of JSON to the timing file, with the host, the stage,
+the task, the wall time, the remote exit code and the bytes sent and
+received. runfab.py prints the slowest tasks and commands at the end
+of a run; the file can also be read later with readRecords.
+"""
+
+from __future__ import with_statement
+import os
+import re
+import json
+import time
+import inspect
+from functools import wraps
+
+from fabric.api import env
+
+timingFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'timing.jsonl')
+
+# Identifies the records of one run. Forked stages inherit it
+runId = time.strftime('%Y%m%dT%H%M%S') + '-' + str(os.getpid())
+
+# Names of the tasks being run in this process, innermost last
+taskStack = []
+
+def currentTask():
+    return taskStack[-1] if taskStack else None
+
+def hidePasswords(command):
+    """
+    Command with the passwords given on the command line masked
+
+    >>> hidePasswords('mysql -u root -p34root43 nova')
+    'mysql -u root -p*** nova'
+    >>> print hidePasswords("GRANT ALL PRIVILEGES ON nova.* TO 'nova'@'%' IDENTIFIED BY '34nova_db43';")
+    GRANT ALL PRIVILEGES ON nova.* TO 'nova'@'%' IDENTIFIED BY ***;
+    >>> hidePasswords('rabbitmqctl change_password guest RabbitPass')
+    'rabbitmqctl change_password guest ***'
+    >>> hidePasswords('keystone user-create --name nova --pass nova_ks')
+    'keystone user-create --name nova --pass ***'
+    """
+    command = re.sub(r"(\s-p)('[^']*'|\S+)", r'\1***', command)
+    command = re.sub(r"(IDENTIFIED BY )('[^']*'|\S+)", r'\1***', command, flags=re.I)
+    command = re.sub(r"(change_password \S+ )('[^']*'|\S+)", r'\1***', command)
+    return re.sub(r"(--(os-)?pass(word)?[ =])('[^']*'|\S+)", r'\1***', command)
+
+def record(kind, name, seconds, **fields):
+    """
+    Append a timing record
+
+    kind is 'task', 'command' or 'parameter'. Host, stage and task
+    are taken from the fabric environment unless given
+    """
+    entry = {
+            'run': runId,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'kind': kind,
+            'name': name,
+            'seconds': round(seconds, 3),
+            'host': env.host_string,
+            'stage': os.path.basename(os.getcwd()),
+            'task': currentTask(),
+            }
+    entry.update(fields)
+    # one short append per record, so parallel tasks don't mix lines
+    with open(timingFile, 'a') as f:
+        f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+def timedTask(task):
+    "Wrap a fabric task so that each run of it, on each host, is recorded"
+    @wraps(task)
+    def inner(*args, **kwargs):
+        taskStack.append(task.__name__)
+        start = time.time()
+        status = 1
+        try:
+            result = task(*args, **kwargs)
+            status = 0
+            return result
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+            raise
+        finally:
+            taskStack.pop()
+            record('task', task.__name__, time.time() - start, exit_code=status)
+    inner.timed = True
+    return inner
+
+def isTask(module, value):
+    "Whether a module attribute is a fabric task defined in that module"
+    return (inspect.isfunction(value)
+            and value.__module__ == module.__name__
+            and (hasattr(value, 'roles') or hasattr(value, 'hosts'))
+            and not getattr(value, 'timed', False))
+
+def timeTasks(module):
+    """
+    Replace the @roles tasks of a fabfile module with timed ones
+
+    The deploy tasks look their tasks up in the module, so they run the
+    timed versions. The prerequisites given with myLib.requires are
+    mapped to the timed versions too, since executeGraph compares them
+    with the tasks it is given
+    """
+    replaced = {}
+    for name, value in vars(module).items():
+        if isTask(module, value):
+            replaced[value] = timedTask(value)
+            setattr(module, name, replaced[value])
+
+    for task in replaced.values():
+        if hasattr(task, 'requires'):
+            task.requires = tuple(replaced.get(t, t) for t in task.requires)
+
+def readRecords(run=None, path=None):
+    "Records of the timing file, only those of one run if given"
+    records = []
+    try:
+        with open(path or timingFile) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if run is None or entry.get('run') == run:
+                    records.append(entry)
+    except IOError:
+        pass
+    return records
+
+def printSummary(records, count=10):
+    "Print the slowest tasks and commands among records"
+    tasks = [r for r in records if r['kind'] == 'task']
+    commands = [r for r in records if r['kind'] != 'task']
+
+    if tasks:
+        print "\nSlowest tasks:"
+        for r in sorted(tasks, key=lambda r: -r['seconds'])[:count]:
+            print "  %8.1f s  %-25s %-30s %s%s" % (r['seconds'], r['stage'], r['name'],
+                    r['host'] or '', '' if r['exit_code'] == 0 else '  (failed)')
+
+    if commands:
+        print "\nSlowest commands:"
+        for r in sorted(commands, key=lambda r: -r['seconds'])[:count]:
+            print "  %8.1f s  %-20s %-40s %s%s" % (r['seconds'], r['host'] or '',
+                    r['name'][:40], r['task'] or r['stage'],
+                    '' if r['exit_code'] == 0 else '  (exit %s)' % r['exit_code'])
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()